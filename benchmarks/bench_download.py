@@ -0,0 +1,98 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure download throughput for a different number of connections against
+a local throttled HTTP server. With `--unpack`, compare "download, then
+unpack" with unpacking while the archive is being downloaded
+
+    python -m benchmarks.bench_download --size-mb 32 --rate-mb 4 --unpack
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+import click
+
+from benchmarks.httpstub import ThrottledHTTPServer
+from pioinstaller import download, util
+
+
+def make_archive(size_mb, files_nums=64):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz", compresslevel=1) as tf:
+        for i in range(files_nums):
+            payload = os.urandom(size_mb * 1024 * 1024 // files_nums)
+            tarinfo = tarfile.TarInfo("python3/lib/file-%d.bin" % i)
+            tarinfo.size = len(payload)
+            tf.addfile(tarinfo, io.BytesIO(payload))
+    return data.getvalue()
+
+
+def compare_unpack(server, tmp_dir, content):
+    url = server.url("/python.tar.gz")
+    server.files["/python.tar.gz"] = content
+    click.echo("%12s %10s" % ("Mode", "Time, s"))
+
+    start = time.time()
+    archive_path = download.download_file(
+        url, os.path.join(tmp_dir, "python.tar.gz"), cache=False
+    )
+    util.unpack_archive(archive_path, os.path.join(tmp_dir, "sequential"))
+    click.echo("%12s %10.2f" % ("sequential", time.time() - start))
+
+    os.environ["PLATFORMIO_CACHE_DIR"] = os.path.join(tmp_dir, "cache")
+    start = time.time()
+    download.download_and_unpack(url, os.path.join(tmp_dir, "pipelined"))
+    click.echo("%12s %10.2f" % ("pipelined", time.time() - start))
+
+
+@click.command()
+@click.option("--size-mb", type=int, default=32)
+@click.option("--rate-mb", type=float, default=4, help="Per-connection limit")
+@click.option("--latency", type=float, default=0.1)
+@click.option("--connections", "-c", type=int, multiple=True, default=(1, 2, 4, 8))
+@click.option("--unpack", is_flag=True, default=False)
+def main(size_mb, rate_mb, latency, connections, unpack):
+    tmp_dir = tempfile.mkdtemp()
+    content = os.urandom(size_mb * 1024 * 1024)
+    click.echo(
+        "File: %d MB, per-connection limit: %.1f MB/s, latency: %d ms"
+        % (size_mb, rate_mb, latency * 1000)
+    )
+    click.echo("%12s %10s %14s" % ("Connections", "Time, s", "Speed, MB/s"))
+    try:
+        with ThrottledHTTPServer(rate=rate_mb * 1024 * 1024, latency=latency) as server:
+            server.files["/archive.tar.gz"] = content
+            for num in connections:
+                dst = os.path.join(tmp_dir, "archive-%d.tar.gz" % num)
+                start = time.time()
+                download.download_file(
+                    server.url("/archive.tar.gz"), dst, cache=False, connections=num
+                )
+                elapsed = time.time() - start
+                assert os.path.getsize(dst) == len(content)
+                click.echo("%12d %10.2f %14.2f" % (num, elapsed, size_mb / elapsed))
+            if unpack:
+                compare_unpack(server, tmp_dir, make_archive(size_mb))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
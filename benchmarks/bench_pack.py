@@ -0,0 +1,72 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare size and startup time of the packed installer formats
+
+    python -m benchmarks.bench_pack --repeat 10
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import click
+
+from pioinstaller.pack import packer
+
+
+def measure_startup(script, repeat, env):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            ["python", script, "--version"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            check=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+@click.command()
+@click.option("--repeat", default=10, show_default=True)
+@click.option("--with-core", is_flag=True, default=False)
+def main(repeat, with_core):
+    tmp_dir = tempfile.mkdtemp()
+    env = dict(os.environ, PLATFORMIO_CACHE_DIR=os.path.join(tmp_dir, "cache"))
+    try:
+        for format_ in ("script", "pyz"):
+            target = packer.pack(
+                os.path.join(tmp_dir, format_), with_core=with_core, format_=format_
+            )
+            click.echo(
+                "%-6s size: %8.1f KB, median startup: %.3fs"
+                % (
+                    format_,
+                    os.path.getsize(target) / 1024.0,
+                    measure_startup(target, repeat, env),
+                )
+            )
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,74 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare per-candidate latency of the `check python` installer probe
+with the lightweight stdlib probe
+
+    python -m benchmarks.bench_probe --installer-script get-platformio.py
+"""
+
+import os
+import statistics
+import subprocess
+import time
+
+import click
+
+from pioinstaller import python
+
+
+def measure(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False
+        )
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+@click.command()
+@click.option(
+    "--installer-script",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    default=os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "get-platformio.py"
+    ),
+)
+@click.option("--repeat", type=int, default=5)
+def main(installer_script, repeat):
+    click.echo(
+        "%-45s %12s %12s %8s" % ("Candidate", "Script, ms", "Probe, ms", "Speedup")
+    )
+    for executable in python.get_python_candidates():
+        script_time = measure(
+            [executable, installer_script, "--no-shutdown-piohome", "check", "python"],
+            repeat,
+        )
+        probe_time = measure([executable, "-c", python.get_probe_code()], repeat)
+        click.echo(
+            "%-45s %12.1f %12.1f %7.1fx"
+            % (
+                executable,
+                script_time * 1000,
+                probe_time * 1000,
+                script_time / probe_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,105 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A local HTTP server with ranges support that emulates a high-latency link:
+every request waits `latency` seconds and every connection is limited to
+`rate` bytes per second
+"""
+
+import hashlib
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class ThrottledHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rate=None, latency=0):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), ThrottledHTTPRequestHandler)
+        self.rate = rate
+        self.latency = latency
+        self.files = {}
+        self.requests = 0
+        self._thread = None
+
+    def url(self, path):
+        return "http://%s:%d%s" % (self.server_address[0], self.server_address[1], path)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+        self.server_close()
+
+
+class ThrottledHTTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    chunk_size = 16 * 1024
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start, end = 0, len(content) - 1
+        is_range = bool(
+            self.headers.get("Range") and self.headers.get("If-Range", etag) == etag
+        )
+        if is_range:
+            start, end = self.headers["Range"].split("=")[1].split("-")
+            start, end = int(start), int(end or len(content) - 1)
+        self.send_response(206 if is_range else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end + 1 - start))
+        if is_range:
+            self.send_header(
+                "Content-Range", "bytes %d-%d/%d" % (start, end, len(content))
+            )
+        self.end_headers()
+        self._send_body(content, start, end)
+
+    def _send_body(self, content, start, end):
+        begin = time.time()
+        sent = 0
+        try:
+            for offset in range(start, end + 1, self.chunk_size):
+                chunk = content[offset : min(offset + self.chunk_size, end + 1)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if self.server.rate:
+                    delay = sent / float(self.server.rate) - (time.time() - begin)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
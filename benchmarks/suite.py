@@ -0,0 +1,342 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline benchmark suite, every benchmark runs against local stubs. Results
+are saved as JSON for comparison between commits
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --only discovery --only download --repeat 5
+"""
+
+import contextlib
+import ensurepip
+import functools
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks.httpstub import ThrottledHTTPServer
+from pioinstaller import __version__, download, penv, python, util
+from pioinstaller.pack import packer
+
+SHIM_DIRS_NUMS = 4
+DOWNLOAD_SIZE_MB = 16
+
+PYTHON_SHIM = '#!/bin/sh\nexec "%s" "$@"\n'
+BROKEN_PYTHON_SHIM = '#!/bin/sh\necho "Python 2.7.18" >&2\nexit 1\n'
+
+
+def measure(func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median": round(statistics.median(timings), 4),
+        "min": round(min(timings), 4),
+        "runs": [round(item, 4) for item in timings],
+    }
+
+
+@contextlib.contextmanager
+def environ(**kwargs):
+    saved = {name: os.environ.get(name) for name in kwargs}
+    os.environ.update(kwargs)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    """
+    Keep stdout for the JSON result, the output of the installer and its
+    child processes goes to stderr
+    """
+    sys.stdout.flush()
+    saved_fd = os.dup(sys.stdout.fileno())
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved_fd, sys.stdout.fileno())
+        os.close(saved_fd)
+
+
+def make_python_shims(shims_dir):
+    """
+    PATH directories with every Python name the installer looks for. Even
+    names run the current interpreter, odd ones an incompatible Python
+    """
+    path_dirs = []
+    names = ["python3", "python3.11", "python3.10", "python3.9", "python3.8"]
+    names += ["python3.7", "python"]
+    for i in range(SHIM_DIRS_NUMS):
+        bin_dir = os.path.join(shims_dir, "bin%d" % i)
+        os.makedirs(bin_dir)
+        for j, name in enumerate(names):
+            path = os.path.join(bin_dir, name)
+            with open(path, "w") as fp:
+                fp.write(BROKEN_PYTHON_SHIM if j % 2 else PYTHON_SHIM % sys.executable)
+            os.chmod(path, 0o755)
+        path_dirs.append(bin_dir)
+    return os.pathsep.join(path_dirs)
+
+
+def bench_discovery(tmp_dir, repeat):
+    if util.IS_WINDOWS:
+        return {"skipped": "Interpreter shims are shell scripts"}
+    with environ(PATH=make_python_shims(os.path.join(tmp_dir, "shims"))):
+        candidates = python.get_python_candidates()
+        return {
+            "candidates": len(candidates),
+            "compatible": len(python.find_compatible_pythons()),
+            "cold": measure(
+                python.find_compatible_pythons, repeat, python.clear_probe_cache
+            ),
+            "warm": measure(python.find_compatible_pythons, repeat),
+        }
+
+
+def make_registry_listing(server):
+    files = []
+    for systype in ("linux_x86_64", "darwin_arm64", "windows_amd64"):
+        files.append(
+            {
+                "system": [systype],
+                "download_url": server.url("/python-%s.tar.gz" % systype),
+                "checksum": {"sha256": "0" * 64},
+            }
+        )
+    versions = [{"name": "3.%d.0" % minor, "files": files} for minor in range(6, 13)]
+    return json.dumps({"versions": versions}).encode()
+
+
+def bench_download(tmp_dir, repeat):
+    content = os.urandom(DOWNLOAD_SIZE_MB * 1024 * 1024)
+    cache_dir = os.path.join(tmp_dir, "cache")
+    dst = os.path.join(tmp_dir, "file.bin")
+    result = {"size": len(content)}
+    with ThrottledHTTPServer() as server:
+        server.files["/file.bin"] = content
+        server.files["/python-portable"] = make_registry_listing(server)
+        url = server.url("/file.bin")
+        with environ(PLATFORMIO_CACHE_DIR=cache_dir):
+            for connections in (1, 4):
+                result["cold_%d" % connections] = measure(
+                    functools.partial(
+                        download.download_file, url, dst, connections=connections
+                    ),
+                    repeat,
+                    lambda: shutil.rmtree(cache_dir, ignore_errors=True),
+                )
+            # the cached copy is revalidated with a conditional request
+            result["revalidate"] = measure(
+                lambda: download.download_file(url, dst), repeat
+            )
+
+            saved_url = python.PORTABLE_PYTHON_REGISTRY_URL
+            python.PORTABLE_PYTHON_REGISTRY_URL = server.url("/python-portable")
+            try:
+                result["registry_cold"] = measure(
+                    python.load_portable_python_index,
+                    repeat,
+                    lambda: util.safe_remove_file(
+                        python.get_portable_python_index_path()
+                    ),
+                )
+                result["registry_revalidate"] = measure(
+                    lambda: python.load_portable_python_index(ttl=0), repeat
+                )
+                result["registry_warm"] = measure(
+                    python.load_portable_python_index, repeat
+                )
+            finally:
+                python.PORTABLE_PYTHON_REGISTRY_URL = saved_url
+    return result
+
+
+def make_wheelhouse(wheelhouse_dir):
+    """
+    A wheelhouse with the PIP wheel bundled with `ensurepip`
+    """
+    os.makedirs(wheelhouse_dir)
+    bundled_dir = os.path.join(os.path.dirname(ensurepip.__file__), "_bundled")
+    for path in glob.glob(os.path.join(bundled_dir, "pip-*.whl")):
+        shutil.copy(path, wheelhouse_dir)
+    return wheelhouse_dir if os.listdir(wheelhouse_dir) else None
+
+
+def bench_penv(tmp_dir, repeat):
+    wheelhouse_dir = make_wheelhouse(os.path.join(tmp_dir, "wheelhouse"))
+    if not wheelhouse_dir:
+        return {"skipped": "PIP wheel is not bundled with `ensurepip`"}
+    cache_dir = os.path.join(tmp_dir, "cache")
+    penv_dir = os.path.join(tmp_dir, "penv")
+
+    def _create():
+        penv.create_core_penv(penv_dir, wheelhouse_dir=wheelhouse_dir)
+
+    with environ(PLATFORMIO_CACHE_DIR=cache_dir):
+        return {
+            # the template is built by the first run
+            "cold": measure(
+                _create,
+                repeat,
+                lambda: shutil.rmtree(cache_dir, ignore_errors=True),
+            ),
+            "warm": measure(_create, repeat, lambda: util.safe_remove_dir(penv_dir)),
+        }
+
+
+def bench_pack(tmp_dir, repeat):
+    result = {
+        "wheels_cached": os.path.isdir(
+            packer.get_wheels_dir(os.path.dirname(util.get_source_dir()))
+        )
+    }
+    for format_, filename in (
+        ("script", "get-platformio.py"),
+        ("pyz", "get-platformio.pyz"),
+    ):
+        target = os.path.join(tmp_dir, filename)
+        result[format_] = measure(
+            functools.partial(packer.pack, target, format_=format_), repeat
+        )
+        result[format_]["size"] = os.path.getsize(target)
+    return result
+
+
+def bench_startup(tmp_dir, repeat):
+    script = packer.pack(os.path.join(tmp_dir, "get-platformio.py"))
+    cache_dir = os.path.join(tmp_dir, "cache")
+    env = dict(
+        os.environ,
+        PLATFORMIO_CORE_DIR=os.path.join(tmp_dir, "core"),
+        PLATFORMIO_CACHE_DIR=cache_dir,
+    )
+
+    def _run():
+        subprocess.run(
+            [sys.executable, script, "check", "python"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            check=True,
+        )
+
+    return {
+        # the embedded payload is decoded and cached by the first run
+        "cold": measure(_run, repeat, lambda: shutil.rmtree(cache_dir, True)),
+        "warm": measure(_run, repeat),
+    }
+
+
+BENCHMARKS = [
+    ("discovery", bench_discovery),
+    ("download", bench_download),
+    ("penv", bench_penv),
+    ("pack", bench_pack),
+    ("startup", bench_startup),
+]
+
+
+def get_git_revision():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.dirname(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except:  # pylint:disable=bare-except
+        return None
+
+
+def run_benchmarks(names, repeat):
+    results = {}
+    root_dir = tempfile.mkdtemp()
+    try:
+        with environ(
+            PLATFORMIO_CORE_DIR=os.path.join(root_dir, "core"),
+            PLATFORMIO_CACHE_DIR=os.path.join(root_dir, "core", ".cache"),
+        ):
+            for name, func in BENCHMARKS:
+                if name not in names:
+                    continue
+                tmp_dir = os.path.join(root_dir, name)
+                os.makedirs(tmp_dir)
+                click.echo("Running %s benchmark" % name, err=True)
+                results[name] = func(tmp_dir, repeat)
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+    return results
+
+
+@click.command()
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+    help="Save results to a file instead of stdout",
+)
+@click.option("--repeat", type=int, default=3, show_default=True)
+@click.option(
+    "--only",
+    type=click.Choice([name for name, _ in BENCHMARKS]),
+    multiple=True,
+    help="Run only the selected benchmarks",
+)
+def main(output, repeat, only):
+    with stdout_to_stderr():
+        results = run_benchmarks(only or [name for name, _ in BENCHMARKS], repeat)
+    data = {
+        "installer_version": __version__,
+        "revision": get_git_revision(),
+        "python_version": platform.python_version(),
+        "system": util.get_systype(),
+        "created_on": int(time.time()),
+        "repeat": repeat,
+        "results": results,
+    }
+    if output:
+        util.dump_json_atomic(output, data)
+    else:
+        click.echo(json.dumps(data, indent=2))
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -15,13 +15,26 @@
 import logging
 import os
 import platform
+import subprocess
 import sys
 
 import click
 
-from pioinstaller import __title__, __version__, core, exception, util
+from pioinstaller import (
+    __title__,
+    __version__,
+    core,
+    exception,
+    profiling,
+    rpc,
+    timing,
+    util,
+)
 from pioinstaller.pack import packer
 from pioinstaller.python import check as python_check
+from pioinstaller.python import clear_probe_cache as clear_python_probe_cache
+from pioinstaller.wheelhouse import build as build_wheelhouse
+from pioinstaller.wheelhouse import get_core_requirement
 
 log = logging.getLogger(__name__)
 
@@ -40,15 +53,44 @@ log = logging.getLogger(__name__)
     "--pypi-index-url",
     help="Custom base URL of the Python Package Index (default `https://pypi.org/simple`)",
 )
+@click.option(
+    "--clear-python-cache",
+    is_flag=True,
+    default=False,
+    help="Remove cached results of Python interpreter checks",
+)
+@click.option(
+    "--wheelhouse",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True),
+    help="Install PlatformIO Core from a local wheelhouse without a package index",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    default=False,
+    help="Print where the time went, per installation phase",
+)
 @click.pass_context
 def cli(
-    ctx, verbose, shutdown_piohome, dev, ignore_python, pypi_index_url
+    ctx,
+    verbose,
+    shutdown_piohome,
+    dev,
+    ignore_python,
+    pypi_index_url,
+    clear_python_cache,
+    wheelhouse,
+    timings,
 ):  # pylint:disable=too-many-arguments
     if verbose:
         logging.getLogger("pioinstaller").setLevel(logging.DEBUG)
+    if clear_python_cache:
+        clear_python_probe_cache()
     if pypi_index_url:
         os.environ["PIP_INDEX_URL"] = pypi_index_url
     ctx.obj["dev"] = dev
+    if timings:
+        ctx.call_on_close(lambda: click.echo(timing.format_table(timing.get_spans())))
     if ctx.invoked_subcommand:
         return
 
@@ -58,7 +100,7 @@ def cli(
     click.echo("Python path: %s" % sys.executable)
 
     try:
-        core.install_platformio_core(shutdown_piohome, dev, ignore_python)
+        core.install_platformio_core(shutdown_piohome, dev, ignore_python, wheelhouse)
     except exception.PIOInstallerException as exc:
         raise click.ClickException(str(exc))
 
@@ -72,8 +114,59 @@ def cli(
         exists=False, file_okay=True, dir_okay=True, writable=True, resolve_path=True
     ),
 )
-def pack(target):
-    return packer.pack(target)
+@click.option(
+    "--with-core",
+    is_flag=True,
+    default=False,
+    help="Embed PlatformIO Core wheels for installing without a network",
+)
+@click.option("--core-version-spec", default=None)
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(["script", "pyz"]),
+    default="script",
+    help="A Python script with an embedded payload or a zipapp",
+)
+def pack(target, with_core, core_version_spec, format_):
+    return packer.pack(target, with_core, core_version_spec, format_)
+
+
+@cli.command("wheelhouse")
+@click.argument(
+    "target",
+    type=click.Path(
+        exists=False, file_okay=False, dir_okay=True, writable=True, resolve_path=True
+    ),
+)
+@click.option("--version-spec", default=None)
+@click.pass_context
+def wheelhouse_cmd(ctx, target, version_spec):
+    requirement = get_core_requirement(version_spec, develop=ctx.obj.get("dev", False))
+    try:
+        lock = build_wheelhouse(target, requirement)
+    except subprocess.CalledProcessError as e:
+        raise click.ClickException("Could not build a wheelhouse: %s" % str(e))
+    click.secho(
+        "Wheelhouse with %d wheels for `%s` has been created at %s"
+        % (len(lock["wheels"]), requirement, target),
+        fg="green",
+    )
+
+
+@cli.command()
+@click.option(
+    "--idle-timeout",
+    type=int,
+    default=rpc.DEFAULT_IDLE_TIMEOUT,
+    help="Exit when no request arrives for this number of seconds",
+)
+@click.pass_context
+def serve(ctx, idle_timeout):
+    """
+    Answer JSON-RPC requests (one per line) from stdin
+    """
+    return rpc.serve(idle_timeout, defaults={"develop": ctx.obj.get("dev", False)})
 
 
 @cli.group()
@@ -130,7 +223,8 @@ def core_check(ctx, **kwargs):
 
 
 def main():
-    return cli(obj={})  # pylint: disable=no-value-for-parameter, unexpected-keyword-arg
+    # pylint: disable=no-value-for-parameter, unexpected-keyword-arg
+    return profiling.run(lambda: cli(obj={}))
 
 
 if __name__ == "__main__":
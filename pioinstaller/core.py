@@ -14,9 +14,12 @@
 
 # pylint: disable=import-outside-toplevel
 
+import functools
+import glob
 import json
 import logging
 import os
+import pkgutil
 import platform
 import subprocess
 import sys
@@ -25,7 +28,7 @@ import time
 import click
 import semantic_version
 
-from pioinstaller import __version__, exception, home, util
+from pioinstaller import __version__, exception, home, http, timing, util
 
 log = logging.getLogger(__name__)
 
@@ -68,12 +71,16 @@ def get_cache_dir():
     return cache_dir
 
 
-def install_platformio_core(shutdown_piohome=True, develop=False, ignore_pythons=None):
+@timing.timed()
+def install_platformio_core(
+    shutdown_piohome=True, develop=False, ignore_pythons=None, wheelhouse_dir=None
+):
     try:
         return _install_platformio_core(
             shutdown_piohome=shutdown_piohome,
             develop=develop,
             ignore_pythons=ignore_pythons,
+            wheelhouse_dir=wheelhouse_dir,
         )
     except subprocess.CalledProcessError as exc:
         # Issue #221: Workaround for Windows OS when username contains a space
@@ -87,30 +94,83 @@ def install_platformio_core(shutdown_piohome=True, develop=False, ignore_pythons
                 shutdown_piohome=shutdown_piohome,
                 develop=develop,
                 ignore_pythons=ignore_pythons,
+                wheelhouse_dir=wheelhouse_dir,
             )
         raise exc
 
 
-def _install_platformio_core(shutdown_piohome=True, develop=False, ignore_pythons=None):
+def _install_platformio_core(
+    shutdown_piohome=True, develop=False, ignore_pythons=None, wheelhouse_dir=None
+):
+    # pylint: disable=bad-option-value, import-outside-toplevel, cyclic-import
+    from pioinstaller import wheelhouse
+
+    tmp_dir = os.path.join(get_cache_dir(), "tmp", "install-%d" % os.getpid())
+    embedded_dir = None
+    prefetch = None
+    if not wheelhouse_dir and not develop:
+        # wheels embedded into a packed `get-platformio.py` script
+        embedded_dir = wheelhouse.extract_embedded(os.path.join(tmp_dir, "wheels"))
+        # the penv interpreter is not known yet, it is usually the current one
+        if not wheelhouse.get_locked_paths(embedded_dir, wheelhouse.get_python_tags()):
+            # download PlatformIO Core wheels while a virtual environment is created
+            prefetch = wheelhouse.WheelPrefetch(
+                "platformio", os.path.join(tmp_dir, "prefetch")
+            ).start()
+    try:
+        return _install_penv_and_core(
+            shutdown_piohome,
+            develop,
+            ignore_pythons,
+            wheelhouse_dir=wheelhouse_dir,
+            embedded_dir=embedded_dir,
+            prefetch=prefetch,
+        )
+    finally:
+        util.safe_remove_dir(tmp_dir)
+
+
+def _install_penv_and_core(  # pylint: disable=too-many-arguments,too-many-locals
+    shutdown_piohome,
+    develop,
+    ignore_pythons,
+    *,
+    wheelhouse_dir=None,
+    embedded_dir=None,
+    prefetch=None
+):
     # pylint: disable=bad-option-value, import-outside-toplevel, unused-import, import-error, unused-variable, cyclic-import
-    from pioinstaller import penv
+    from pioinstaller import penv, wheelhouse
 
     if shutdown_piohome:
         home.shutdown_pio_home_servers()
 
-    penv_dir = penv.create_core_penv(ignore_pythons=ignore_pythons)
+    penv_dir = penv.create_core_penv(
+        ignore_pythons=ignore_pythons, wheelhouse_dir=wheelhouse_dir or embedded_dir
+    )
     python_exe = os.path.join(
         penv.get_penv_bin_dir(penv_dir), "python.exe" if util.IS_WINDOWS else "python"
     )
     command = [python_exe, "-m", "pip", "install", "-U"]
-    if develop:
-        click.echo("Installing a development version of PlatformIO Core")
-        command.append(PIO_CORE_DEVELOP_URL)
+    requirement = PIO_CORE_DEVELOP_URL if develop else "platformio"
+    local_args = None
+    if wheelhouse_dir:
+        click.echo("Installing PlatformIO Core from a wheelhouse %s" % wheelhouse_dir)
+        command.extend(
+            wheelhouse.get_install_args(
+                wheelhouse_dir, wheelhouse.get_python_tags(python_exe)
+            )
+        )
     else:
-        click.echo("Installing PlatformIO Core")
-        command.append("platformio")
+        local_args = _get_local_install_args(python_exe, embedded_dir, prefetch)
+        if develop:
+            click.echo("Installing a development version of PlatformIO Core")
+        else:
+            click.echo("Installing PlatformIO Core")
+        if not local_args:
+            command.append(requirement)
     try:
-        subprocess.check_call(command)
+        _pip_install(command, local_args, requirement)
     except Exception as e:  # pylint:disable=broad-except
         error = str(e)
         if util.IS_WINDOWS:
@@ -125,6 +185,7 @@ def _install_platformio_core(shutdown_piohome=True, develop=False, ignore_python
         penv.get_penv_bin_dir(penv_dir),
         "platformio.exe" if util.IS_WINDOWS else "platformio",
     )
+    log.debug("HTTP connections opened: %d", http.get_session().get_connections_count())
 
     click.secho(
         "\nPlatformIO Core has been successfully installed into an isolated environment `%s`!\n"
@@ -139,13 +200,43 @@ If you need an access to `platformio.exe` from other applications, please instal
 (add PlatformIO Core binary directory `%s` to the system environment PATH variable):
 
 See https://docs.platformio.org/page/installation.html#install-shell-commands
-"""
-        % penv.get_penv_bin_dir(penv_dir),
+""" % penv.get_penv_bin_dir(penv_dir),
         fg="cyan",
     )
     return True
 
 
+def _get_local_install_args(python_exe, embedded_dir=None, prefetch=None):
+    """
+    Embedded or prefetched wheels are installed as-is when they are built for
+    the Python version and platform of the penv interpreter
+    """
+    from pioinstaller import wheelhouse
+
+    prefetched = prefetch.wait() if prefetch else None
+    if not embedded_dir and not prefetched:
+        return None
+    python_tags = wheelhouse.get_python_tags(python_exe)
+    embedded_paths = wheelhouse.get_locked_paths(embedded_dir, python_tags)
+    if embedded_paths:
+        log.debug("Installing PlatformIO Core from embedded wheels")
+        return ["--no-index", "--no-deps"] + embedded_paths
+    return prefetch.get_install_args(python_tags) if prefetched else None
+
+
+def _pip_install(command, local_args=None, requirement=None):
+    if not local_args:
+        return subprocess.check_call(command)
+    try:
+        return subprocess.check_call(command + local_args)
+    except subprocess.CalledProcessError as e:
+        # PIP rejects wheels with tags that the interpreter does not support
+        log.debug("Could not install PlatformIO Core from local wheels: %s", e)
+    click.echo("Installing PlatformIO Core from the package index")
+    return subprocess.check_call(command + [requirement])
+
+
+@timing.timed("core.check")
 def check(develop=False, global_=False, auto_upgrade=False, version_spec=None):
     from pioinstaller import penv
 
@@ -168,22 +259,11 @@ def check(develop=False, global_=False, auto_upgrade=False, version_spec=None):
         raise exception.InvalidPlatformIOCore(
             "PlatformIO executable not found in `%s`" % penv.get_penv_bin_dir()
         )
-    try:
-        subprocess.check_output([platformio_exe, "--help"], stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as e:
-        error = e.output.decode()
-        raise exception.InvalidPlatformIOCore(
-            "Could not run `%s --help`.\nError: %s" % (platformio_exe, str(error))
-        )
-
-    result = {}
-    try:
-        result = fetch_python_state(python_exe)
-    except subprocess.CalledProcessError as e:
-        error = e.output.decode()
-        raise exception.InvalidPlatformIOCore(
-            "Could not import PlatformIO module. Error: %s" % error
-        )
+    result = None if global_ else load_cached_core_state(python_exe)
+    if not result:
+        result = fetch_core_state(python_exe)
+        if not global_:
+            save_cached_core_state(python_exe, result)
     piocore_version = convert_version(result.get("core_version"))
     develop = develop or bool(piocore_version.prerelease if piocore_version else False)
     result.update(
@@ -205,15 +285,15 @@ def check(develop=False, global_=False, auto_upgrade=False, version_spec=None):
     if not global_:
         _check_platform_version()
     if auto_upgrade and not global_:
+        upgraded = False
         try:
-            auto_upgrade_core(platformio_exe, develop)
+            upgraded = auto_upgrade_core(platformio_exe, develop)
         except:  # pylint:disable=bare-except
             pass
-        # re-fetch Pyrhon state
-        try:
-            result.update(fetch_python_state(python_exe))
-        except:  # pylint:disable=bare-except
-            raise exception.InvalidPlatformIOCore("Could not import PlatformIO module")
+        # re-fetch PlatformIO Core state
+        if upgraded:
+            result.update(fetch_core_state(python_exe))
+            save_cached_core_state(python_exe, result)
 
     return result
 
@@ -253,36 +333,130 @@ def _check_platform_version():
     )
 
 
-def fetch_python_state(python_exe):
-    code = """
-import json
-import platform
-import sys
+@functools.lru_cache(maxsize=None)
+def get_core_probe_code():
+    return pkgutil.get_data("pioinstaller", "coreprobe.py").decode()
 
-import platformio
 
-if sys.version_info < (3, 6):
-    raise Exception(
-        "Unsupported Python version: %s. "
-        "Minimum supported Python version is 3.6 or above."
-        % platform.python_version(),
-    )
+def fetch_core_state(python_exe):
+    """
+    Python and PlatformIO Core versions and health of the CLI entry point
+    in one probe process
+    """
+    start = time.time()
+    try:
+        output = subprocess.check_output(
+            [python_exe, "-c", get_core_probe_code()], stderr=subprocess.STDOUT
+        )
+        state = json.loads(output.decode())
+        assert isinstance(state, dict)
+    except (OSError, ValueError, AssertionError, subprocess.CalledProcessError) as e:
+        error = e.output.decode() if getattr(e, "output", None) else str(e)
+        raise exception.InvalidPlatformIOCore(
+            "Could not import PlatformIO module. Error: %s" % error
+        )
+    state["timings"]["probe"] = round(time.time() - start, 4)
+    log.debug("PlatformIO Core probe timings: %s", state["timings"])
+    error = state.pop("error", None)
+    if error and error["check"] == "entry_point":
+        raise exception.InvalidPlatformIOCore(
+            "Could not load PlatformIO Core CLI.\nError: %s" % error["message"]
+        )
+    if error:
+        raise exception.InvalidPlatformIOCore(
+            "Could not import PlatformIO module. Error: %s" % error["message"]
+        )
+    return state
+
+
+def get_core_fingerprint(python_exe):
+    """
+    Stat fingerprint of a virtual environment with PlatformIO Core, it changes
+    when packages are installed or removed, or the base Python is replaced
+    """
+    from pioinstaller import penv
 
-state = {
-   "core_version": platformio.__version__,
-   "python_version": platform.python_version()
-}
-print(json.dumps(state))
-"""
-    state = subprocess.check_output(
-        [
-            python_exe,
-            "-c",
-            code,
-        ],
-        stderr=subprocess.STDOUT,
+    penv_dir = penv.get_penv_dir()
+    site_packages_dirs = glob.glob(
+        os.path.join(penv_dir, "Lib", "site-packages")
+        if util.IS_WINDOWS
+        else os.path.join(penv_dir, "lib", "python*", "site-packages")
     )
-    return json.loads(state.decode())
+    if len(site_packages_dirs) != 1:
+        return None
+    records = glob.glob(
+        os.path.join(site_packages_dirs[0], "platformio-*.dist-info", "RECORD")
+    )
+    if len(records) != 1:
+        return None
+    result = {}
+    for name, path in (
+        ("site_packages", site_packages_dirs[0]),
+        ("record", records[0]),
+        ("python", python_exe),
+        ("pyvenv_cfg", os.path.join(penv_dir, "pyvenv.cfg")),
+    ):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        result[name] = [st.st_mtime, st.st_size]
+    result["dist_info"] = os.path.dirname(records[0])
+    return result
+
+
+def read_core_version(dist_info_dir):
+    with open(os.path.join(dist_info_dir, "METADATA")) as fp:
+        for line in fp:
+            if line.startswith("Version:"):
+                return line.split(":", 1)[1].strip()
+            if not line.strip():
+                break
+    return None
+
+
+def load_cached_core_state(python_exe):
+    """
+    The last probe result when the virtual environment has not changed since
+    """
+    from pioinstaller import penv
+
+    start = time.time()
+    try:
+        cached = penv.load_state().get("core_probe") or {}
+        fingerprint = get_core_fingerprint(python_exe)
+        if not fingerprint or cached.get("fingerprint") != fingerprint:
+            return None
+        result = dict(cached["state"])
+        result["core_version"] = read_core_version(fingerprint["dist_info"])
+    except:  # pylint:disable=bare-except
+        return None
+    if not result["core_version"]:
+        return None
+    result["timings"] = {"fingerprint": round(time.time() - start, 4)}
+    log.debug("Using cached PlatformIO Core state")
+    return result
+
+
+def save_cached_core_state(python_exe, result):
+    from pioinstaller import penv
+
+    try:
+        state = penv.load_state()
+        fingerprint = get_core_fingerprint(python_exe)
+    except exception.PIOInstallerException:
+        return False
+    if not fingerprint:
+        return False
+    state["core_probe"] = {
+        "fingerprint": fingerprint,
+        "state": {
+            key: result.get(key)
+            for key in ("core_version", "python_version", "entry_point", "pip_version")
+        },
+    }
+    penv.save_state(state)
+    return True
 
 
 def convert_version(version):
@@ -334,4 +508,4 @@ def dump_state(target, state):
         os.makedirs(os.path.dirname(target))
 
     with open(target, "w") as fp:
-        json.dump(state, fp)
+        json.dump(dict(state, spans=timing.get_spans()), fp)
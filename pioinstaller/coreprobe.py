@@ -0,0 +1,86 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The source of this module is passed to the PlatformIO Core interpreter with
+# `python -c`. It must depend only on the standard library, PlatformIO Core is
+# imported by the checks below.
+
+# pylint:disable=bad-option-value,import-outside-toplevel,import-error
+# pylint:disable=broad-exception-raised
+
+import json
+import platform
+import sys
+import time
+import traceback
+
+ENTRY_POINT = "platformio.__main__:main"
+
+
+def check_python():
+    if sys.version_info < (3, 6):
+        raise Exception(
+            "Unsupported Python version: %s. "
+            "Minimum supported Python version is 3.6 or above."
+            % platform.python_version(),
+        )
+    return {"python_version": platform.python_version()}
+
+
+def check_core():
+    import platformio
+
+    return {"core_version": platformio.__version__}
+
+
+def check_entry_point():
+    module_name, attr = ENTRY_POINT.split(":")
+    module = __import__(module_name, fromlist=[attr])
+    if not callable(getattr(module, attr, None)):
+        raise Exception("Invalid PlatformIO Core entry point `%s`" % ENTRY_POINT)
+    return {"entry_point": ENTRY_POINT}
+
+
+def check_pip():
+    try:
+        from importlib import metadata
+    except ImportError:
+        return {}
+    try:
+        return {"pip_version": metadata.version("pip")}
+    except metadata.PackageNotFoundError:
+        return {"pip_version": None}
+
+
+def main():
+    state = {"timings": {}}
+    for name, func in (
+        ("python", check_python),
+        ("core", check_core),
+        ("entry_point", check_entry_point),
+        ("pip", check_pip),
+    ):
+        start = time.time()
+        try:
+            state.update(func())
+        except Exception:  # pylint: disable=broad-except
+            state["error"] = {"check": name, "message": traceback.format_exc()}
+            break
+        finally:
+            state["timings"][name] = round(time.time() - start, 4)
+    sys.stdout.write(json.dumps(state))
+
+
+if __name__ == "__main__":
+    main()
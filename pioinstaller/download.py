@@ -0,0 +1,591 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import concurrent.futures
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import tarfile
+import threading
+import time
+
+import requests
+
+from pioinstaller import core, exception, http, timing, util
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MAX_ATTEMPTS = 5
+SEGMENTED_MIN_SIZE = 8 * 1024 * 1024
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+def get_download_cache_dir():
+    return os.path.join(core.get_cache_dir(), "downloads")
+
+
+def get_object_path(sha256):
+    return os.path.join(get_download_cache_dir(), "objects", sha256[:2], sha256)
+
+
+def get_meta_path(url):
+    return os.path.join(
+        get_download_cache_dir(),
+        "urls",
+        "%s.json" % hashlib.sha1(url.encode()).hexdigest(),
+    )
+
+
+def load_meta(url):
+    try:
+        with open(get_meta_path(url)) as fp:
+            meta = json.load(fp)
+        assert meta.get("url") == url
+        object_path = get_object_path(meta["sha256"])
+        assert os.path.getsize(object_path) == meta["size"]
+        return meta
+    except:  # pylint:disable=bare-except
+        pass
+    return None
+
+
+def save_meta(url, sha256, size, headers):
+    prev_meta = load_meta(url)
+    meta = {
+        "url": url,
+        "sha256": sha256,
+        "size": size,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+    }
+    util.dump_json_atomic(get_meta_path(url), meta)
+    if prev_meta and prev_meta["sha256"] != sha256:
+        util.safe_remove_file(get_object_path(prev_meta["sha256"]))
+    return meta
+
+
+def get_part_path(url):
+    return os.path.join(
+        get_download_cache_dir(),
+        "partial",
+        "%s.part" % hashlib.sha1(url.encode()).hexdigest(),
+    )
+
+
+@timing.timed()
+def download_file(url, dst, cache=True, sha256=None, connections=1):
+    """
+    Download `url` to `dst`. Cached files are content-addressed by SHA-256 and
+    revalidated with `If-None-Match` / `If-Modified-Since`. Large files are
+    fetched over `connections` concurrent range requests when a server allows
+    """
+    if not cache:
+        with _PartFile(dst + ".part") as part:
+            _download(url, part.path, sha256, connections=connections)
+            os.replace(part.path, dst)
+        return dst
+
+    if sha256 and os.path.isfile(get_object_path(sha256)):
+        log.debug("Getting from cache: %s", url)
+        return _materialize(get_object_path(sha256), dst)
+
+    meta = load_meta(url)
+    if meta and sha256 and meta["sha256"] != sha256.lower():
+        meta = None
+
+    result = None
+    try:
+        with _PartFile(get_part_path(url)) as part:
+            result = _download(
+                url, part.path, sha256, _get_conditional_headers(meta), connections
+            )
+            if result:
+                _store_object(part.path, result[0])
+    except requests.RequestException as e:
+        if not meta or isinstance(e, requests.HTTPError):
+            raise e
+        log.debug("Could not revalidate %s, using cached copy. Error: %s", url, e)
+
+    if not result:
+        log.debug("Getting from cache: %s", url)
+        return _materialize(get_object_path(meta["sha256"]), dst)
+    digest, size, resp_headers = result
+    save_meta(url, digest, size, resp_headers)
+    return _materialize(get_object_path(digest), dst)
+
+
+def download_and_unpack(url, dst_dir, sha256=None):
+    """
+    Extract a `.tar.gz` archive while it is being downloaded. The stream is
+    hashed and kept in the cache, an interrupted one is resumed by
+    `download_file`. Files are moved to `dst_dir` only after verification
+    """
+    tmp_dir = "%s.%d.tmp" % (os.path.normpath(dst_dir), os.getpid())
+    util.safe_remove_dir(tmp_dir)
+    try:
+        _download_and_unpack(url, tmp_dir, sha256)
+        util.safe_remove_dir(dst_dir)
+        os.rename(tmp_dir, dst_dir)
+    except:  # pylint:disable=bare-except
+        util.safe_remove_dir(tmp_dir)
+        util.safe_remove_dir(dst_dir)
+        raise
+    return dst_dir
+
+
+def _download_and_unpack(url, dst_dir, sha256=None):
+    if sha256 and os.path.isfile(get_object_path(sha256)):
+        log.debug("Unpacking from cache: %s", url)
+        return _unpack_object(get_object_path(sha256), dst_dir)
+
+    meta = load_meta(url)
+    if meta and sha256 and meta["sha256"] != sha256.lower():
+        meta = None
+    try:
+        resp = http.get_session().get(
+            url, stream=True, headers=_get_conditional_headers(meta)
+        )
+    except requests.RequestException as e:
+        if not meta:
+            raise e
+        log.debug("Could not revalidate %s, using cached copy. Error: %s", url, e)
+        resp = None
+
+    if resp is not None and resp.status_code == 304 and meta:
+        resp.close()
+        resp = None
+    if resp is None:
+        log.debug("Unpacking from cache: %s", url)
+        return _unpack_object(get_object_path(meta["sha256"]), dst_dir)
+
+    with resp, _PartFile(get_part_path(url)) as part:
+        resp.raise_for_status()
+        _save_part_state(url, part.path, resp.headers)
+        with _PipelinedReader(resp, part.path) as reader:
+            with tarfile.open(fileobj=reader, mode="r|gz") as tf:
+                tf.extractall(dst_dir)
+            digest, size = reader.finish()
+        _verify_checksum(part.path, url, digest, sha256)
+        util.safe_remove_file(part.path + ".json")
+        _store_object(part.path, digest)
+    save_meta(url, digest, size, resp.headers)
+    return dst_dir
+
+
+def _unpack_object(object_path, dst_dir):
+    with tarfile.open(object_path, mode="r:gz") as tf:
+        tf.extractall(dst_dir)
+    return dst_dir
+
+
+class _PipelinedReader(io.RawIOBase):
+    """
+    A file-like object over a response body. A background thread reads the
+    network, hashes and saves the stream, so extraction does not stall it
+    """
+
+    QUEUE_SIZE = 256
+
+    def __init__(self, resp, path):
+        super(_PipelinedReader, self).__init__()
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._chunk = memoryview(b"")
+        self._eof = False
+        self._error = None
+        self._hasher = hashlib.sha256()
+        self._size = 0
+        self._thread = threading.Thread(target=self._pump, args=(resp, path))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _pump(self, resp, path):
+        try:
+            with open(path, "wb") as fp:
+                for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                    if self.closed:
+                        break
+                    self._hasher.update(chunk)
+                    self._size += len(chunk)
+                    fp.write(chunk)
+                    timing.add_bytes_downloaded(len(chunk))
+                    while not self.closed:
+                        try:
+                            self._queue.put(chunk, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+            expected_size = _get_expected_size(resp)
+            if expected_size is not None and self._size != expected_size:
+                raise requests.exceptions.ChunkedEncodingError(
+                    "Connection broken: received %d bytes of %d"
+                    % (self._size, expected_size)
+                )
+        except Exception as e:  # pylint: disable=broad-except
+            self._error = e
+        finally:
+            self._queue.put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._chunk and not self._eof:
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._chunk = memoryview(chunk)
+        if self._eof and self._error:
+            raise self._error
+        size = min(len(b), len(self._chunk))
+        b[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def finish(self):
+        # tar archives end with padding which an extractor does not read
+        while self.readinto(bytearray(CHUNK_SIZE)):
+            pass
+        self._thread.join()
+        return self._hasher.hexdigest(), self._size
+
+    def close(self):
+        # the pump thread stops feeding a closed reader
+        super(_PipelinedReader, self).close()
+        while not self._eof and self._thread.is_alive():
+            try:
+                self._eof = self._queue.get(timeout=0.1) is None
+            except queue.Empty:
+                pass
+
+
+class _PartFile(object):
+    """
+    A `.part` file is shared between runs to resume an interrupted download.
+    When another process holds it, a private one is used instead
+    """
+
+    STALE_LOCK_TIMEOUT = 60 * 60
+
+    def __init__(self, path):
+        self.path = path
+        self._lock_path = None
+
+    def __enter__(self):
+        util.safe_create_dir(os.path.dirname(self.path))
+        lock_path = self.path + ".lock"
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                self._lock_path = lock_path
+                return self
+            except OSError:
+                try:
+                    lock_age = time.time() - os.path.getmtime(lock_path)
+                except OSError:
+                    continue
+                if lock_age < self.STALE_LOCK_TIMEOUT:
+                    break
+                util.safe_remove_file(lock_path)
+        self.path = "%s.%d" % (self.path, os.getpid())
+        return self
+
+    def __exit__(self, *_):
+        if not self._lock_path:
+            # a private part file can not be resumed by other runs
+            util.safe_remove_file(self.path)
+            util.safe_remove_file(self.path + ".json")
+            return
+        util.safe_remove_file(self._lock_path)
+
+
+def _download(url, part_path, sha256=None, headers=None, connections=1):
+    """
+    Fetch `url` into `part_path` and resume interrupted transfers with HTTP
+    Range requests. Returns None when a server responds with "304 Not Modified"
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        req_headers = dict(headers or {})
+        offset, validator = _load_part_state(url, part_path)
+        if offset and validator:
+            log.debug("Resuming download of %s from %d bytes", url, offset)
+            req_headers["Range"] = "bytes=%d-" % offset
+            req_headers["If-Range"] = validator
+        elif connections > 1:
+            # a server that supports ranges reports the total size with 206
+            req_headers["Range"] = "bytes=0-"
+        try:
+            with http.get_session().get(url, stream=True, headers=req_headers) as resp:
+                if resp.status_code == 304:
+                    return None
+                if offset and resp.status_code == 416:
+                    # the part file is complete or longer than the remote file
+                    log.debug("Could not resume download of %s, restarting", url)
+                    util.safe_remove_file(part_path + ".json")
+                    util.safe_remove_file(part_path)
+                    return _download(url, part_path, sha256, headers, connections)
+                resp.raise_for_status()
+                if offset and not _is_range_response(resp, offset):
+                    offset = 0
+                if not offset and connections > 1 and _is_segmentable(resp):
+                    try:
+                        return _download_segments(resp, part_path, connections, sha256)
+                    except _RangeNotSupported as e:
+                        # a restart, not a retry of an interrupted transfer
+                        log.debug("Falling back to a single connection: %s", e)
+                        return _download(url, part_path, sha256, headers)
+                if not offset:
+                    _save_part_state(url, part_path, resp.headers)
+                digest, size = _write_response(resp, part_path, offset, sha256)
+                util.safe_remove_file(part_path + ".json")
+                return digest, size, resp.headers
+        except RETRY_EXCEPTIONS as e:
+            # resume only transfers that have made progress
+            resumable = _load_part_state(url, part_path)[0] > offset
+            if not resumable or attempt == MAX_ATTEMPTS:
+                raise e
+            log.debug("Download of %s has been interrupted: %s", url, e)
+    return None
+
+
+class _RangeNotSupported(Exception):
+    pass
+
+
+def _is_range_response(resp, offset):
+    return resp.status_code == 206 and resp.headers.get("Content-Range", "").startswith(
+        "bytes %d-" % offset
+    )
+
+
+def _get_validator(headers):
+    validator = headers.get("ETag") or headers.get("Last-Modified")
+    # weak validators can not be used with `If-Range`
+    if validator and not validator.startswith("W/"):
+        return validator
+    return None
+
+
+def _is_segmentable(resp):
+    total = _get_expected_size(resp)
+    return bool(
+        _is_range_response(resp, 0)
+        and total
+        and total >= SEGMENTED_MIN_SIZE
+        and _get_validator(resp.headers)
+    )
+
+
+def _download_segments(resp, part_path, connections, sha256=None):
+    """
+    Fetch equal byte ranges over concurrent connections into a preallocated
+    file. The first segment continues reading the initial response
+    """
+    total = _get_expected_size(resp)
+    segment_size = -(-total // connections)
+    segments = [
+        (start, min(start + segment_size, total) - 1)
+        for start in range(0, total, segment_size)
+    ]
+    log.debug("Downloading %s over %d connections", resp.url, len(segments))
+    util.safe_remove_file(part_path + ".json")
+    util.safe_create_dir(os.path.dirname(part_path))
+    with open(part_path, "wb") as fp:
+        fp.truncate(total)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        futures = [
+            executor.submit(
+                _fetch_segment,
+                resp.url,
+                _get_validator(resp.headers),
+                part_path,
+                segment,
+                resp if segment[0] == 0 else None,
+            )
+            for segment in segments
+        ]
+        for future in futures:
+            future.result()
+
+    hasher = hashlib.sha256()
+    with open(part_path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    _verify_checksum(part_path, resp.url, digest, sha256)
+    return digest, total, resp.headers
+
+
+def _fetch_segment(url, validator, path, segment, resp=None):
+    start, end = segment
+    position = start
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            if resp is None:
+                resp = http.get_session().get(
+                    url,
+                    stream=True,
+                    headers={
+                        "Range": "bytes=%d-%d" % (position, end),
+                        "If-Range": validator,
+                    },
+                )
+                resp.raise_for_status()
+                if not _is_range_response(resp, position):
+                    resp.close()
+                    raise _RangeNotSupported(
+                        "Unexpected response for bytes %d-%d of %s"
+                        % (position, end, url)
+                    )
+            with resp:
+                position = _write_range(resp, path, position, end)
+            if position > end:
+                return True
+            raise requests.exceptions.ChunkedEncodingError(
+                "Connection broken: received %d bytes of %d"
+                % (position - start, end + 1 - start)
+            )
+        except RETRY_EXCEPTIONS as e:
+            if attempt == MAX_ATTEMPTS:
+                raise e
+            log.debug(
+                "Segment %d-%d of %s has been interrupted: %s", start, end, url, e
+            )
+        resp = None
+    return False
+
+
+def _write_range(resp, path, position, end):
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            chunk = chunk[: end + 1 - position]
+            while chunk:
+                if hasattr(os, "pwrite"):
+                    written = os.pwrite(fd, chunk, position)
+                else:  # Windows, every segment has own file descriptor
+                    os.lseek(fd, position, os.SEEK_SET)
+                    written = os.write(fd, chunk)
+                timing.add_bytes_downloaded(written)
+                chunk = chunk[written:]
+                position += written
+            if position > end:
+                break
+    finally:
+        os.close(fd)
+    return position
+
+
+def _load_part_state(url, part_path):
+    try:
+        with open(part_path + ".json") as fp:
+            state = json.load(fp)
+        assert state["url"] == url and state["validator"]
+        return os.path.getsize(part_path), state["validator"]
+    except:  # pylint:disable=bare-except
+        pass
+    return 0, None
+
+
+def _save_part_state(url, part_path, headers):
+    util.safe_remove_file(part_path + ".json")
+    validator = _get_validator(headers)
+    if validator:
+        util.dump_json_atomic(part_path + ".json", {"url": url, "validator": validator})
+
+
+def _write_response(resp, path, offset=0, sha256=None):
+    """
+    Stream a response body to `path` starting at `offset` and hash it on the fly
+    """
+    hasher = hashlib.sha256()
+    size = offset
+    util.safe_create_dir(os.path.dirname(path))
+    with open(path, "ab" if offset else "wb") as fp:
+        if offset:
+            fp.truncate(offset)
+            with open(path, "rb") as fp_prefix:
+                for chunk in iter(lambda: fp_prefix.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+            fp.write(chunk)
+            timing.add_bytes_downloaded(len(chunk))
+    expected_size = _get_expected_size(resp)
+    if expected_size is not None and size != expected_size:
+        raise requests.exceptions.ChunkedEncodingError(
+            "Connection broken: received %d bytes of %d" % (size, expected_size)
+        )
+    digest = hasher.hexdigest()
+    _verify_checksum(path, resp.url, digest, sha256)
+    return digest, size
+
+
+def _verify_checksum(path, url, digest, sha256=None):
+    if not sha256 or digest == sha256.lower():
+        return True
+    util.safe_remove_file(path)
+    util.safe_remove_file(path + ".json")
+    raise exception.DownloadError(
+        "Checksum mismatch for %s: expected %s, got %s" % (url, sha256, digest)
+    )
+
+
+def _get_expected_size(resp):
+    if resp.status_code == 206:
+        total = resp.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else None
+    length = resp.headers.get("Content-Length", "")
+    # a decoded body does not match the length of encoded content
+    if not length.isdigit() or resp.headers.get("Content-Encoding"):
+        return None
+    return int(length)
+
+
+def _get_conditional_headers(meta):
+    headers = {}
+    if meta and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _store_object(path, sha256):
+    object_path = get_object_path(sha256)
+    util.safe_create_dir(os.path.dirname(object_path))
+    os.replace(path, object_path)
+    return object_path
+
+
+def _materialize(object_path, dst):
+    if os.path.abspath(object_path) == os.path.abspath(dst):
+        return dst
+    util.safe_create_dir(os.path.dirname(dst))
+    util.safe_remove_file(dst)
+    try:
+        os.link(object_path, dst)
+    except OSError:
+        shutil.copyfile(object_path, dst)
+    return dst
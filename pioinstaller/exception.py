@@ -34,3 +34,7 @@ class PythonVenvModuleNotFound(PIOInstallerException):
 
 class InvalidPlatformIOCore(PIOInstallerException):
     MESSAGE = "{0}"
+
+
+class DownloadError(PIOInstallerException):
+    MESSAGE = "{0}"
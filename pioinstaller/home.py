@@ -12,32 +12,100 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
 import logging
-import multiprocessing
+import selectors
+import socket
+import time
 
-import requests
+from pioinstaller import http, timing
 
 HTTP_HOST = "127.0.0.1"
 HTTP_PORT_BEGIN = 8008
 HTTP_PORT_END = 8050
 
+CONNECT_TIMEOUT = 0.5
+SHUTDOWN_TIMEOUT = 10
+
 log = logging.getLogger(__name__)
 
 
-def _shutdown():
-    for port in range(HTTP_PORT_BEGIN, HTTP_PORT_END):
-        try:
-            requests.get(
-                "http://%s:%d?__shutdown__=1" % (HTTP_HOST, port), timeout=(0.5, 2)
-            )
-            log.debug("The server %s:%d is stopped", HTTP_HOST, port)
-        except:  # pylint:disable=bare-except
-            pass
+def find_listening_ports(ports, host=HTTP_HOST, timeout=CONNECT_TIMEOUT):
+    """
+    Non-blocking connect sweep, all ports are probed at once
+    """
+    result = []
+    selector = selectors.DefaultSelector()
+    try:
+        for port in ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                sock.connect((host, port))
+                result.append(port)
+                sock.close()
+                continue
+            except BlockingIOError:
+                # a pending connection, `WSAEWOULDBLOCK` on Windows and
+                # `EINPROGRESS` elsewhere
+                pass
+            except OSError:
+                sock.close()
+                continue
+            selector.register(sock, selectors.EVENT_WRITE, port)
+
+        deadline = time.time() + timeout
+        while selector.get_map():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                sock = key.fileobj
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    result.append(key.data)
+                selector.unregister(sock)
+                sock.close()
+    finally:
+        for key in list(selector.get_map().values()):
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+        selector.close()
+    return sorted(result)
+
+
+def _request_shutdown(session, host, port):
+    try:
+        session.get("http://%s:%d?__shutdown__=1" % (host, port), timeout=(0.5, 2))
+    except:  # pylint:disable=bare-except
+        pass
+
+
+def shutdown_servers(ports, host=HTTP_HOST, timeout=SHUTDOWN_TIMEOUT):
+    if not ports:
+        return []
+    # a server that is stopping drops the connection, do not retry it
+    session = http.HTTPSession(max_retries=0)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        for port in ports:
+            executor.submit(_request_shutdown, session, host, port)
+    session.close()
+
+    # wait for the servers to release their ports
+    deadline = time.time() + timeout
+    running = list(ports)
+    while running and time.time() < deadline:
+        running = find_listening_ports(running, host)
+        if running:
+            time.sleep(0.1)
+    for port in ports:
+        if port in running:
+            log.debug("The server %s:%d is still running", host, port)
+        else:
+            log.debug("The server %s:%d is stopped", host, port)
+    return [port for port in ports if port not in running]
 
 
+@timing.timed()
 def shutdown_pio_home_servers():
-    proc = multiprocessing.Process(target=_shutdown)
-    proc.start()
-    proc.join(10)
-    proc.terminate()
+    shutdown_servers(find_listening_ports(range(HTTP_PORT_BEGIN, HTTP_PORT_END)))
     return True
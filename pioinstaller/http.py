@@ -0,0 +1,78 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pioinstaller import __title__, __version__
+
+DEFAULT_TIMEOUT = (10, 30)  # connect, read
+MAX_RETRIES = 3
+POOL_MAXSIZE = 16
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+class HTTPSession(requests.Session):
+    """
+    Keep-alive connections are pooled per host and shared by all threads.
+    Proxies are taken from HTTP(S)_PROXY / NO_PROXY environment variables
+    """
+
+    def __init__(self, max_retries=MAX_RETRIES):
+        super(HTTPSession, self).__init__()
+        self.headers.update({"User-Agent": "%s/%s" % (__title__, __version__)})
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        for prefix in ("http://", "https://"):
+            self.mount(
+                prefix,
+                HTTPAdapter(
+                    max_retries=retry,
+                    pool_connections=POOL_MAXSIZE,
+                    pool_maxsize=POOL_MAXSIZE,
+                ),
+            )
+
+    def request(  # pylint: disable=signature-differs
+        self, method, url, *args, **kwargs
+    ):
+        kwargs["timeout"] = kwargs.get("timeout") or DEFAULT_TIMEOUT
+        return super(HTTPSession, self).request(method, url, *args, **kwargs)
+
+    def get_connections_count(self):
+        result = 0
+        for adapter in set(self.adapters.values()):
+            managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+            for manager in managers:
+                for key in manager.pools.keys():
+                    pool = manager.pools.get(key)
+                    result += getattr(pool, "num_connections", 0)
+        return result
+
+
+def get_session():
+    global _SESSION  # pylint: disable=global-statement
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = HTTPSession()
+        return _SESSION
@@ -13,51 +13,216 @@
 # limitations under the License.
 
 import base64
+import hashlib
 import io
 import os
-import re
 import shutil
 import subprocess
+import sys
 import tempfile
 import zipfile
 
-from pioinstaller import util
+import click
+
+from pioinstaller import download, penv, util, wheelhouse
+
+ZIPAPP_SHEBANG = b"#!/usr/bin/env python3\n"
+ZIPAPP_MAIN = """\
+import pioinstaller.__main__
+
+pioinstaller.__main__.main()
+"""
+
+# fixed metadata of archive members for byte-for-byte reproducible output
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o644 << 16
+BASE64_CHUNK_SIZE = 57 * 1024  # a multiple of 57 bytes, 76-char lines
+COPY_CHUNK_SIZE = 64 * 1024
 
 
 def create_wheels(package_dir, dest_dir):
-    subprocess.call(["pip", "wheel", "--wheel-dir", dest_dir, "."], cwd=package_dir)
+    subprocess.check_call(
+        ["pip", "wheel", "--wheel-dir", dest_dir, "."], cwd=package_dir
+    )
+
+
+def get_source_hash(package_dir):
+    """
+    Sources of the installer and the interpreter the dependencies are built for
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(("%s %s" % (sys.version_info[:2], util.get_systype())).encode())
+    paths = [os.path.join(package_dir, name) for name in ("setup.py", "README.rst")]
+    for root, dirs, files in os.walk(os.path.join(package_dir, "pioinstaller")):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        paths.extend(
+            os.path.join(root, name) for name in sorted(files) if name.endswith(".py")
+        )
+    for path in paths:
+        sha256.update(os.path.relpath(path, package_dir).replace(os.sep, "/").encode())
+        with open(path, "rb") as fp:
+            sha256.update(hashlib.sha256(fp.read()).digest())
+    return sha256.hexdigest()
+
+
+def get_wheels_dir(package_dir):
+    """
+    Wheels are rebuilt only when the sources change
+    """
+    wheels_dir = os.path.join(
+        package_dir, ".cache", "wheels", get_source_hash(package_dir)
+    )
+    if os.path.isdir(wheels_dir):
+        return wheels_dir
+    tmp_dir = "%s.%d.tmp" % (wheels_dir, os.getpid())
+    util.safe_remove_dir(tmp_dir)
+    os.makedirs(tmp_dir)
+    # only a complete build is moved to the cache
+    try:
+        create_wheels(package_dir, tmp_dir)
+    except subprocess.CalledProcessError as e:
+        util.safe_remove_dir(tmp_dir)
+        raise click.ClickException("Could not build installer wheels: %s" % e)
+    if not [name for name in os.listdir(tmp_dir) if name.endswith(".whl")]:
+        util.safe_remove_dir(tmp_dir)
+        raise click.ClickException("Could not build installer wheels")
+    try:
+        os.rename(tmp_dir, wheels_dir)
+    except OSError:
+        # built by a concurrent `pack`
+        util.safe_remove_dir(tmp_dir)
+    return wheels_dir
+
+
+def create_core_wheelhouse(dest_dir, version_spec=None):
+    """
+    PlatformIO Core with its dependency tree, PIP and virtualenv bootstrap
+    """
+    wheelhouse.build(dest_dir, wheelhouse.get_core_requirement(version_spec))
+    subprocess.check_call(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "download",
+            "--only-binary",
+            ":all:",
+            "--no-deps",
+            "--dest",
+            dest_dir,
+            "pip",
+        ]
+    )
+    try:
+        download.download_file(
+            penv.VIRTUALENV_URL,
+            os.path.join(dest_dir, os.path.basename(penv.VIRTUALENV_URL)),
+        )
+    except Exception as e:  # pylint:disable=broad-except
+        # only needed for interpreters without the `venv` module
+        click.secho("Could not embed virtualenv script: %s" % str(e), fg="yellow")
+    return dest_dir
 
 
-def pack(target):
+def add_zip_member(zf, name, fileobj, compress_type=zipfile.ZIP_DEFLATED):
+    zinfo = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+    zinfo.external_attr = ZIP_FILE_MODE
+    zinfo.compress_type = compress_type
+    with zf.open(zinfo, "w") as dst:
+        shutil.copyfileobj(fileobj, dst, COPY_CHUNK_SIZE)
+
+
+def create_payload(dst_fp, wheels_dir, wheelhouse_dir=None, zipapp=False):
+    """
+    Members are streamed one by one in a stable order
+    """
+    members = {}
+    for whl in sorted(os.listdir(wheels_dir)):
+        if not whl.endswith(".whl"):
+            continue
+        with zipfile.ZipFile(os.path.join(wheels_dir, whl)) as zf:
+            for name in zf.namelist():
+                if ".dist-info/" not in name and not name.endswith("/"):
+                    members.setdefault(name, whl)
+    with zipfile.ZipFile(dst_fp, mode="w") as new_zip:
+        for name in sorted(members):
+            with zipfile.ZipFile(os.path.join(wheels_dir, members[name])) as zf:
+                with zf.open(name) as src:
+                    add_zip_member(new_zip, name, src)
+        if wheelhouse_dir:
+            for name in sorted(os.listdir(wheelhouse_dir)):
+                with open(os.path.join(wheelhouse_dir, name), "rb") as src:
+                    # wheels are compressed already
+                    add_zip_member(
+                        new_zip,
+                        "%s/%s" % (wheelhouse.EMBEDDED_DIR, name),
+                        src,
+                        compress_type=zipfile.ZIP_STORED,
+                    )
+        if zipapp:
+            add_zip_member(new_zip, "__main__.py", io.BytesIO(ZIPAPP_MAIN.encode()))
+    return dst_fp
+
+
+def pack(target, with_core=False, core_version_spec=None, format_="script"):
     assert isinstance(target, str)
+    assert format_ in ("script", "pyz")
 
     if os.path.isdir(target):
-        target = os.path.join(target, "get-platformio.py")
+        target = os.path.join(
+            target, "get-platformio.%s" % ("pyz" if format_ == "pyz" else "py")
+        )
     if not os.path.isdir(os.path.dirname(target)):
         os.makedirs(os.path.dirname(target))
 
+    wheels_dir = get_wheels_dir(os.path.dirname(util.get_source_dir()))
     tmp_dir = tempfile.mkdtemp()
-    create_wheels(os.path.dirname(util.get_source_dir()), tmp_dir)
-
-    new_data = io.BytesIO()
-    for whl in os.listdir(tmp_dir):
-        with zipfile.ZipFile(os.path.join(tmp_dir, whl)) as existing_zip:
-            with zipfile.ZipFile(new_data, mode="a") as new_zip:
-                for zinfo in existing_zip.infolist():
-                    if re.search(r"\.dist-info/", zinfo.filename):
-                        continue
-                    new_zip.writestr(zinfo, existing_zip.read(zinfo))
-    zipdata = base64.b64encode(new_data.getvalue()).decode("utf8")
-    with open(target, "w") as fp:
-        with open(os.path.join(util.get_source_dir(), "pack", "template.py")) as fptlp:
-            fp.write(fptlp.read().format(zipfile_content=zipdata))
-
-    # Ensure the permissions on the newly created file
-    oldmode = os.stat(target).st_mode & 0o7777
-    newmode = (oldmode | 0o555) & 0o7777
-    os.chmod(target, newmode)
-
-    # Clearing up
-    shutil.rmtree(tmp_dir)
+    try:
+        wheelhouse_dir = None
+        if with_core:
+            wheelhouse_dir = create_core_wheelhouse(
+                os.path.join(tmp_dir, "wheelhouse"), core_version_spec
+            )
+        payload_path = os.path.join(tmp_dir, "payload.zip")
+        with open(payload_path, "w+b") as fp:
+            create_payload(fp, wheels_dir, wheelhouse_dir, zipapp=format_ == "pyz")
+        tmp_target = "%s.%d.tmp" % (target, os.getpid())
+        if format_ == "pyz":
+            write_zipapp(tmp_target, payload_path)
+        else:
+            write_script(tmp_target, payload_path)
+        # Ensure the permissions on the newly created file
+        oldmode = os.stat(tmp_target).st_mode & 0o7777
+        os.chmod(tmp_target, (oldmode | 0o555) & 0o7777)
+        os.replace(tmp_target, target)
+    finally:
+        # Clearing up
+        shutil.rmtree(tmp_dir)
+
+    return target
+
+
+def write_script(target, payload_path):
+    with open(os.path.join(util.get_source_dir(), "pack", "template.py")) as fp:
+        template_head, template_tail = fp.read().split("{zipfile_content}")
+    sha256 = hashlib.sha256()
+    with open(payload_path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(COPY_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    with open(payload_path, "rb") as src, open(target, "w", newline="\n") as dst:
+        dst.write(template_head)
+        for chunk in iter(lambda: src.read(BASE64_CHUNK_SIZE), b""):
+            dst.write(base64.encodebytes(chunk).decode("utf8"))
+        dst.write(template_tail.format(zipfile_sha256=sha256.hexdigest()))
+    return target
+
 
+def write_zipapp(target, payload_path):
+    """
+    The interpreter imports the installer straight from the archive,
+    nothing is decoded or written at startup
+    """
+    with open(payload_path, "rb") as src, open(target, "wb") as dst:
+        dst.write(ZIPAPP_SHEBANG)
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
     return target
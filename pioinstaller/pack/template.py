@@ -14,15 +14,19 @@
 
 # pylint:disable=bad-option-value,import-outside-toplevel
 
+import hashlib
 import os
 import shutil
 import sys
 import tempfile
+import time
 from base64 import b64decode
 
 DEPENDENCIES = b"""
 {zipfile_content}
 """
+DEPENDENCIES_SHA256 = "{zipfile_sha256}"
+PAYLOAD_MAX_AGE = 60 * 60 * 24 * 7  # unused payloads of other versions
 
 
 def create_temp_dir():
@@ -42,6 +46,89 @@ def create_temp_dir():
     return tempfile.mkdtemp()
 
 
+def get_core_dir():
+    """
+    The rule of `pioinstaller.core.get_core_dir`, the installer is not
+    importable yet
+    """
+    if os.getenv("PLATFORMIO_CORE_DIR"):
+        return os.getenv("PLATFORMIO_CORE_DIR")
+    if not sys.platform.lower().startswith("win"):
+        return os.path.join(os.path.expanduser("~"), ".platformio")
+    core_dir = os.path.join(
+        os.getenv("USERPROFILE") or os.path.expanduser("~"), ".platformio"
+    )
+    win_root_dir = os.path.splitdrive(core_dir)[0] + "\\.platformio"
+    if os.path.isdir(win_root_dir):
+        return win_root_dir
+    if any(ord(c) >= 128 for c in core_dir):
+        # raises OSError when the root directory is not writable, the payload
+        # is not cached then
+        os.makedirs(win_root_dir)
+        return win_root_dir
+    return core_dir
+
+
+def get_payload_cache_dir():
+    if os.getenv("PLATFORMIO_CACHE_DIR"):
+        return os.path.join(os.getenv("PLATFORMIO_CACHE_DIR"), "installer")
+    return os.path.join(get_core_dir(), ".cache", "installer")
+
+
+def is_payload_valid(path):
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+                sha256.update(chunk)
+    except (IOError, OSError):
+        return False
+    return sha256.hexdigest() == DEPENDENCIES_SHA256
+
+
+def extract_cached_payload():
+    """
+    The payload is decoded once per content hash and shared by all runs. A
+    damaged copy, such as one truncated by a crash, is decoded again
+    """
+    cache_dir = get_payload_cache_dir()
+    path = os.path.join(cache_dir, "pioinstaller-%s.zip" % DEPENDENCIES_SHA256)
+    if os.path.isfile(path) and is_payload_valid(path):
+        os.utime(path, None)  # protect from cleanup by other versions
+        return path
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as fp:
+            fp.write(b64decode(DEPENDENCIES))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        # a concurrent run has just created it
+        if not os.path.isfile(path):
+            raise
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+    cleanup_payload_cache(cache_dir, path)
+    return path
+
+
+def cleanup_payload_cache(cache_dir, current_path):
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if path == current_path or not name.startswith("pioinstaller-"):
+            continue
+        try:
+            max_age = 60 * 60 if name.endswith(".tmp") else PAYLOAD_MAX_AGE
+            if time.time() - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+
 def bootstrap():
     import pioinstaller.__main__
 
@@ -53,9 +140,12 @@ def main():
     os.environ["TMPDIR"] = runtime_tmp_dir
     tmp_dir = tempfile.mkdtemp(dir=runtime_tmp_dir)
     try:
-        pioinstaller_zip = os.path.join(tmp_dir, "pioinstaller.zip")
-        with open(pioinstaller_zip, "wb") as fp:
-            fp.write(b64decode(DEPENDENCIES))
+        try:
+            pioinstaller_zip = extract_cached_payload()
+        except (IOError, OSError):
+            pioinstaller_zip = os.path.join(tmp_dir, "pioinstaller.zip")
+            with open(pioinstaller_zip, "wb") as fp:
+                fp.write(b64decode(DEPENDENCIES))
 
         sys.path.insert(0, pioinstaller_zip)
 
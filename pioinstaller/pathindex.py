@@ -0,0 +1,115 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import threading
+
+IS_WINDOWS = sys.platform.lower().startswith("win")
+
+# bin_dir -> (mtime, normalized names of directory entries)
+_DIR_INDEX = {}
+_DIR_INDEX_LOCK = threading.Lock()
+
+
+def get_path_dirs(envpath=None):
+    envpath = os.getenv("PATH", "") if envpath is None else envpath
+    result = []
+    seen = set()
+    for bin_dir in envpath.split(os.pathsep):
+        if not bin_dir:
+            continue
+        key = os.path.normcase(os.path.normpath(bin_dir))
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(bin_dir)
+    return result
+
+
+def get_dir_names(bin_dir):
+    """
+    Names of directory entries, the directory is re-scanned only when it changes
+    """
+    try:
+        mtime = os.stat(bin_dir).st_mtime_ns
+    except OSError:
+        return set()
+    with _DIR_INDEX_LOCK:
+        cached = _DIR_INDEX.get(bin_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    names = set()
+    try:
+        with os.scandir(bin_dir) as it:
+            for entry in it:
+                names.add(os.path.normcase(entry.name))
+    except OSError:
+        pass
+    with _DIR_INDEX_LOCK:
+        _DIR_INDEX[bin_dir] = (mtime, names)
+    return names
+
+
+def is_executable_file(path):
+    if not os.path.isfile(path):
+        return False
+    return IS_WINDOWS or os.access(path, os.X_OK)
+
+
+def find_programs(names, envpath=None):
+    """
+    All matches for `names` ordered by name priority and then by PATH order
+    """
+    bin_dirs = [(d, get_dir_names(d)) for d in get_path_dirs(envpath)]
+    result = []
+    for name in names:
+        for bin_dir, dir_names in bin_dirs:
+            if os.path.normcase(name) not in dir_names:
+                continue
+            path = os.path.join(bin_dir, name)
+            if is_executable_file(path):
+                result.append(path)
+    return result
+
+
+def where_is(name, envpath=None):
+    for path in find_programs([name], envpath):
+        return path
+    return None
+
+
+def get_file_id(path):
+    try:
+        st = os.stat(path)
+        if st.st_ino:
+            return (st.st_dev, st.st_ino)
+    except OSError:
+        pass
+    return os.path.normcase(os.path.realpath(path))
+
+
+def unique_paths(paths, key=None):
+    """
+    Collapse paths that point to the same file (symlinks, hard links)
+    """
+    result = []
+    seen = set()
+    for path in paths:
+        file_id = key(path) if key else get_file_id(path)
+        if file_id in seen:
+            continue
+        seen.add(file_id)
+        result.append(path)
+    return result
@@ -12,16 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import hashlib
 import json
 import logging
 import os
 import platform
+import shutil
 import subprocess
+import sys
 import time
 
 import click
 
-from pioinstaller import __version__, core, exception, python, util
+from pioinstaller import (
+    __version__,
+    core,
+    download,
+    exception,
+    python,
+    timing,
+    util,
+    wheelhouse,
+)
 
 log = logging.getLogger(__name__)
 
@@ -29,6 +42,10 @@ log = logging.getLogger(__name__)
 VIRTUALENV_URL = "https://bootstrap.pypa.io/virtualenv/virtualenv.pyz"
 PIP_URL = "https://bootstrap.pypa.io/get-pip.py"
 
+PENV_TEMPLATE_MANIFEST = "penv-template.json"
+PENV_TEMPLATE_MAX_AGE = 60 * 60 * 24 * 7  # 7 days, then pip is refreshed
+MAX_SHEBANG_LENGTH = 127
+
 
 def get_penv_dir(path=None):
     if os.getenv("PLATFORMIO_PENV_DIR"):
@@ -43,21 +60,29 @@ def get_penv_bin_dir(path=None):
     return os.path.join(penv_dir, "Scripts" if util.IS_WINDOWS else "bin")
 
 
-def create_core_penv(penv_dir=None, ignore_pythons=None):
+@timing.timed()
+def create_core_penv(penv_dir=None, ignore_pythons=None, wheelhouse_dir=None):
     penv_dir = penv_dir or get_penv_dir()
 
     click.echo("Creating a virtual environment at %s" % penv_dir)
 
     result_dir = None
-    for python_exe in python.find_compatible_pythons(ignore_pythons):
-        result_dir = create_virtualenv(python_exe, penv_dir)
-        if result_dir:
-            break
+    pip_updated = False
+    # stop probing the rest of candidates as soon as a virtualenv is created
+    with contextlib.closing(python.iter_compatible_pythons(ignore_pythons)) as pythons:
+        for python_exe in pythons:
+            result_dir = create_from_template(python_exe, penv_dir, wheelhouse_dir)
+            if result_dir:
+                pip_updated = True
+                break
+            result_dir = create_virtualenv(python_exe, penv_dir, wheelhouse_dir)
+            if result_dir:
+                break
 
     if not result_dir and not python.is_portable():
         python_exe = python.fetch_portable_python(os.path.dirname(penv_dir))
         if python_exe:
-            result_dir = create_virtualenv(python_exe, penv_dir)
+            result_dir = create_virtualenv(python_exe, penv_dir, wheelhouse_dir)
 
     if not result_dir:
         raise exception.PIOInstallerException(
@@ -69,12 +94,14 @@ def create_core_penv(penv_dir=None, ignore_pythons=None):
         get_penv_bin_dir(penv_dir), "python.exe" if util.IS_WINDOWS else "python"
     )
     init_state(python_exe, penv_dir)
-    update_pip(python_exe, penv_dir)
+    if not pip_updated:
+        update_pip(python_exe, penv_dir, wheelhouse_dir)
     click.echo("Virtual environment has been successfully created!")
     return result_dir
 
 
-def create_virtualenv(python_exe, penv_dir):
+@timing.timed()
+def create_virtualenv(python_exe, penv_dir, wheelhouse_dir=None):
     log.debug("Using %s Python for virtual environment.", python_exe)
     try:
         return create_with_local_venv(python_exe, penv_dir)
@@ -85,7 +112,7 @@ def create_virtualenv(python_exe, penv_dir):
             str(e),
         )
         try:
-            return create_with_remote_venv(python_exe, penv_dir)
+            return create_with_remote_venv(python_exe, penv_dir, wheelhouse_dir)
         except Exception as exc:  # pylint:disable=broad-except
             log.debug(
                 "Could not create virtualenv with downloaded script. Error: %s",
@@ -114,16 +141,23 @@ def create_with_local_venv(python_exe, penv_dir):
     raise last_error  # pylint:disable=raising-bad-type
 
 
-def create_with_remote_venv(python_exe, penv_dir):
+def create_with_remote_venv(python_exe, penv_dir, wheelhouse_dir=None):
     util.safe_remove_dir(penv_dir)
 
-    log.debug("Downloading virtualenv package archive")
-    venv_script_path = util.download_file(
-        VIRTUALENV_URL,
-        os.path.join(
-            os.path.dirname(penv_dir), ".cache", "tmp", os.path.basename(VIRTUALENV_URL)
-        ),
+    venv_script_path = wheelhouse.find_file(
+        wheelhouse_dir, os.path.basename(VIRTUALENV_URL)
     )
+    if not venv_script_path:
+        log.debug("Downloading virtualenv package archive")
+        venv_script_path = download.download_file(
+            VIRTUALENV_URL,
+            os.path.join(
+                os.path.dirname(penv_dir),
+                ".cache",
+                "tmp",
+                os.path.basename(VIRTUALENV_URL),
+            ),
+        )
     if not venv_script_path:
         raise exception.PIOInstallerException("Could not find virtualenv script")
     command = [python_exe, venv_script_path, penv_dir]
@@ -132,6 +166,175 @@ def create_with_remote_venv(python_exe, penv_dir):
     return penv_dir
 
 
+def get_penv_templates_dir():
+    return os.path.join(core.get_cache_dir(), "penv-templates")
+
+
+def get_penv_template_dir(python_exe):
+    fingerprint = python.get_python_fingerprint(python_exe)
+    if not fingerprint:
+        return None
+    key = hashlib.sha1(
+        json.dumps(
+            [os.path.realpath(python_exe), fingerprint, __version__], sort_keys=True
+        ).encode()
+    ).hexdigest()
+    return os.path.join(get_penv_templates_dir(), key)
+
+
+def load_penv_template_manifest(template_dir):
+    try:
+        with open(os.path.join(template_dir, PENV_TEMPLATE_MANIFEST)) as fp:
+            manifest = json.load(fp)
+        assert 0 <= time.time() - manifest["created_on"] < PENV_TEMPLATE_MAX_AGE
+        assert os.path.isabs(manifest["path"])
+        return manifest
+    except:  # pylint:disable=bare-except
+        pass
+    return None
+
+
+def create_from_template(python_exe, penv_dir, wheelhouse_dir=None):
+    """
+    Clone a cached "golden" virtual environment with up-to-date PIP that was
+    built once per base interpreter. Scripts with absolute paths are rewritten,
+    the rest of files are reflinked or hardlinked when the file system allows
+    """
+    if util.IS_WINDOWS:
+        # the `.exe` launchers of console scripts embed the interpreter path
+        return None
+    bin_dir = get_penv_bin_dir(os.path.abspath(penv_dir))
+    if len("#!" + os.path.join(bin_dir, "python")) > MAX_SHEBANG_LENGTH:
+        return None
+    try:
+        template_dir = get_penv_template_dir(python_exe)
+        if not template_dir:
+            return None
+        manifest = load_penv_template_manifest(template_dir)
+        if not manifest:
+            manifest = build_penv_template(python_exe, template_dir, wheelhouse_dir)
+        if not manifest:
+            return None
+        log.debug("Cloning virtual environment from %s", template_dir)
+        util.safe_remove_dir(penv_dir)
+        clone_penv_template(template_dir, manifest["path"], penv_dir)
+        return penv_dir
+    except Exception as e:  # pylint:disable=broad-except
+        log.debug("Could not clone virtual environment template: %s", str(e))
+        util.safe_remove_dir(penv_dir)
+    return None
+
+
+def build_penv_template(python_exe, template_dir, wheelhouse_dir=None):
+    templates_dir = os.path.dirname(template_dir)
+    prune_penv_templates(templates_dir)
+    build_dir = "%s.%d.tmp" % (template_dir, os.getpid())
+    util.safe_remove_dir(build_dir)
+    log.debug("Building virtual environment template at %s", build_dir)
+    try:
+        if not create_with_local_venv(python_exe, build_dir):
+            return None
+        build_python_exe = os.path.join(get_penv_bin_dir(build_dir), "python")
+        if not update_pip(build_python_exe, build_dir, wheelhouse_dir):
+            return None
+        manifest = {
+            "path": os.path.abspath(build_dir),
+            "python": os.path.realpath(python_exe),
+            "created_on": int(time.time()),
+        }
+        with open(os.path.join(build_dir, PENV_TEMPLATE_MANIFEST), "w") as fp:
+            json.dump(manifest, fp)
+        trash_dir = None
+        if os.path.isdir(template_dir):
+            trash_dir = "%s.%d.old" % (template_dir, os.getpid())
+            os.rename(template_dir, trash_dir)
+        try:
+            os.rename(build_dir, template_dir)
+        except OSError:
+            # a concurrent installer has just built the same template
+            return load_penv_template_manifest(template_dir)
+        finally:
+            if trash_dir:
+                util.safe_remove_dir(trash_dir)
+        return manifest
+    finally:
+        util.safe_remove_dir(build_dir)
+
+
+def prune_penv_templates(templates_dir):
+    if not os.path.isdir(templates_dir):
+        return
+    for name in os.listdir(templates_dir):
+        path = os.path.join(templates_dir, name)
+        if name.endswith((".tmp", ".old")):
+            # leftovers of interrupted builds
+            stale = time.time() - os.path.getmtime(path) > 60 * 60
+        else:
+            stale = not load_penv_template_manifest(path)
+        if stale:
+            util.safe_remove_dir(path)
+
+
+def clone_penv_template(template_dir, template_path, penv_dir):
+    shutil.copytree(
+        template_dir,
+        penv_dir,
+        symlinks=True,
+        ignore=shutil.ignore_patterns(PENV_TEMPLATE_MANIFEST),
+        copy_function=_clone_file,
+    )
+    src = os.fsencode(template_path)
+    dst = os.fsencode(os.path.abspath(penv_dir))
+    bin_dir = get_penv_bin_dir(penv_dir)
+    paths = [os.path.join(penv_dir, "pyvenv.cfg")] + [
+        os.path.join(bin_dir, name) for name in os.listdir(bin_dir)
+    ]
+    for path in paths:
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as fp:
+            content = fp.read()
+        if src not in content:
+            continue
+        # files may be hardlinked to the template, never modify them in place
+        mode = os.stat(path).st_mode
+        os.remove(path)
+        with open(path, "wb") as fp:
+            fp.write(content.replace(src, dst))
+        os.chmod(path, mode)
+    return penv_dir
+
+
+def _clone_file(src, dst):
+    for method in (_reflink_file, os.link):
+        try:
+            method(src, dst)
+            return dst
+        except (OSError, AttributeError, ImportError):
+            util.safe_remove_file(dst)
+    return shutil.copy2(src, dst)
+
+
+def _reflink_file(src, dst):
+    # pylint: disable=import-outside-toplevel
+    if sys.platform == "darwin":
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile failed", src)
+        return dst
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflinks are not supported")
+    import fcntl
+
+    FICLONE = 0x40049409  # pylint: disable=invalid-name
+    with open(src, "rb") as src_fp, open(dst, "wb") as dst_fp:
+        fcntl.ioctl(dst_fp.fileno(), FICLONE, src_fp.fileno())
+    shutil.copystat(src, dst)
+    return dst
+
+
 def init_state(python_exe, penv_dir):
     version_code = (
         "import sys; version=sys.version_info; "
@@ -172,24 +375,24 @@ def load_state(penv_dir=None):
 
 def save_state(state, penv_dir=None):
     penv_dir = penv_dir or get_penv_dir()
-    state_path = os.path.join(penv_dir, "state.json")
-    with open(state_path, "w") as fp:
-        json.dump(state, fp)
-    return state_path
+    # concurrent `check core` runs read the state while it is being updated
+    return util.dump_json_atomic(os.path.join(penv_dir, "state.json"), state)
 
 
-def update_pip(python_exe, penv_dir):
+@timing.timed()
+def update_pip(python_exe, penv_dir, wheelhouse_dir=None):
     click.echo("Updating Python package manager (PIP) in the virtual environment")
     try:
         log.debug("Creating pip.conf file in %s", penv_dir)
         with open(os.path.join(penv_dir, "pip.conf"), "w") as fp:
             fp.write("\n".join(["[global]", "user=no"]))
 
+        command = [python_exe, "-m", "pip", "install", "-U", "pip"]
+        if wheelhouse.find_file(wheelhouse_dir, "pip-*.whl"):
+            command[-1:] = ["--no-index", "--find-links", wheelhouse_dir, "pip"]
         try:
             log.debug("Updating PIP ...")
-            subprocess.run(
-                [python_exe, "-m", "pip", "install", "-U", "pip"], check=True
-            )
+            subprocess.run(command, check=True)
         except subprocess.CalledProcessError as e:
             log.debug(
                 "Could not update PIP. Error: %s",
@@ -199,7 +402,7 @@ def update_pip(python_exe, penv_dir):
             get_pip_path = os.path.join(
                 os.path.dirname(penv_dir), ".cache", "tmp", os.path.basename(PIP_URL)
             )
-            util.download_file(PIP_URL, get_pip_path)
+            download.download_file(PIP_URL, get_pip_path)
             log.debug("Installing PIP ...")
             subprocess.run([python_exe, get_pip_path], check=True)
 
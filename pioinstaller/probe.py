@@ -0,0 +1,118 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The source of this module is passed to candidate interpreters with `python -c`.
+# It must depend only on the standard library and stay Python 2 compatible,
+# so an old interpreter reports its incompatibility instead of crashing.
+
+# pylint:disable=bad-option-value,consider-using-with,too-many-return-statements
+
+import json
+import os
+import platform
+import sys
+import tempfile
+
+IS_WINDOWS = sys.platform.lower().startswith("win")
+IS_MACOS = sys.platform.lower() == "darwin"
+
+VENV_MODULE_NOT_FOUND = "Could not find Python `venv` module"
+
+
+def get_pythonexe_path():
+    return os.environ.get("PYTHONEXEPATH", os.path.normpath(sys.executable))
+
+
+def is_conda():
+    return any(
+        [
+            os.path.exists(os.path.join(sys.prefix, "conda-meta")),
+            # (os.getenv("CONDA_PREFIX") or os.getenv("CONDA_DEFAULT_ENV")),
+            "anaconda" in sys.executable.lower(),
+            "miniconda" in sys.executable.lower(),
+            "continuum analytics" in sys.version.lower(),
+            "conda" in sys.version.lower(),
+        ]
+    )
+
+
+def get_incompatibility_reason():
+    # platform check
+    if sys.platform == "cygwin":
+        return "Unsupported Cygwin platform"
+
+    # version check
+    if sys.version_info < (3, 6):
+        return (
+            "Unsupported Python version: %s. "
+            "Minimum supported Python version is 3.6 or above."
+            % platform.python_version()
+        )
+
+    # conda check
+    if is_conda():
+        return "Conda is not supported"
+
+    try:
+        __import__("ensurepip")
+        __import__("venv")
+        # __import__("distutils.command")
+    except ImportError:
+        return VENV_MODULE_NOT_FOUND
+
+    # portable Python 3 for macOS is not compatible with macOS < 10.13
+    # https://github.com/platformio/platformio-core-installer/issues/70
+    if IS_MACOS:
+        with tempfile.NamedTemporaryFile() as tmpfile:
+            os.utime(tmpfile.name, None)
+
+    if not IS_WINDOWS:
+        return None
+
+    # windows check
+    if any(s in get_pythonexe_path().lower() for s in ("msys", "mingw", "emacs")):
+        return "Unsupported environments: msys, mingw, emacs >> %s" % (
+            get_pythonexe_path()
+        )
+
+    try:
+        assert os.path.isdir(os.path.join(sys.prefix, "Scripts")) or (
+            sys.version_info >= (3, 5) and __import__("venv")
+        )
+    except (AssertionError, ImportError):
+        return "Unsupported python without 'Scripts' folder and 'venv' module"
+
+    return None
+
+
+def main():
+    try:
+        reason = get_incompatibility_reason()
+    except Exception as e:  # pylint: disable=broad-except
+        reason = str(e) or e.__class__.__name__
+    sys.stdout.write(
+        json.dumps(
+            {
+                "compatible": reason is None,
+                "version": platform.python_version(),
+                "executable": get_pythonexe_path(),
+                "reason": reason,
+                "venv_missing": reason == VENV_MODULE_NOT_FOUND,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+import click
+
+PROFILE_ENV = "PIOINSTALLER_PROFILE"
+PROFILE_DIR_ENV = "PIOINSTALLER_PROFILE_DIR"
+PROFILE_DIRNAME = "pioinstaller-profile"
+PROFILE_MODES = ("cpu", "mem")
+REPORT_LIMIT = 30
+
+
+def get_profile_mode():
+    mode = (os.getenv(PROFILE_ENV) or "").strip().lower()
+    return mode if mode in PROFILE_MODES else None
+
+
+def get_dump_state_path(argv):
+    for i, arg in enumerate(argv):
+        if arg.startswith("--dump-state="):
+            return arg.split("=", 1)[1]
+        if arg == "--dump-state" and i + 1 < len(argv):
+            return argv[i + 1]
+    return None
+
+
+def get_profile_dir(argv=None):
+    """
+    A directory next to the state dump when `--dump-state` is passed,
+    otherwise in the PlatformIO cache
+    """
+    if os.getenv(PROFILE_DIR_ENV):
+        return os.getenv(PROFILE_DIR_ENV)
+    dump_state = get_dump_state_path(sys.argv[1:] if argv is None else argv)
+    if dump_state:
+        dump_state = os.path.abspath(dump_state)
+        if os.path.isdir(dump_state):
+            return os.path.join(dump_state, PROFILE_DIRNAME)
+        return os.path.join(os.path.dirname(dump_state), PROFILE_DIRNAME)
+    from pioinstaller import core  # pylint: disable=import-outside-toplevel
+
+    return os.path.join(core.get_cache_dir(), PROFILE_DIRNAME)
+
+
+def get_report_prefix(profile_dir):
+    if not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    return os.path.join(
+        profile_dir,
+        "pioinstaller-%s-%d" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid()),
+    )
+
+
+def save_cpu_report(profiler, prefix):
+    profiler.dump_stats(prefix + ".prof")
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(REPORT_LIMIT)
+    with open(prefix + "-cpu.txt", "w") as fp:
+        fp.write(stream.getvalue())
+    return [prefix + ".prof", prefix + "-cpu.txt"]
+
+
+def save_mem_report(snapshot, peak, prefix):
+    lines = ["Peak traced memory: %.1f KB" % (peak / 1024.0), ""]
+    lines.append("Top %d allocations by line:" % REPORT_LIMIT)
+    for stat in snapshot.statistics("lineno")[:REPORT_LIMIT]:
+        lines.append(str(stat))
+    with open(prefix + "-mem.txt", "w") as fp:
+        fp.write("\n".join(lines) + "\n")
+    return [prefix + "-mem.txt"]
+
+
+def run(func, mode=None, profile_dir=None):
+    """
+    Call `func` under cProfile (`cpu`) or tracemalloc (`mem`) selected by the
+    `PIOINSTALLER_PROFILE` variable, reports are saved even when it fails
+    """
+    mode = mode or get_profile_mode()
+    if not mode:
+        return func()
+    profiler = None
+    if mode == "cpu":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        tracemalloc.start()
+    try:
+        return func()
+    finally:
+        prefix = get_report_prefix(profile_dir or get_profile_dir())
+        if profiler:
+            profiler.disable()
+            paths = save_cpu_report(profiler, prefix)
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            paths = save_mem_report(snapshot, peak, prefix)
+        click.echo("Profile has been saved to %s" % ", ".join(paths), err=True)
@@ -12,35 +12,44 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
+import functools
 import glob
 import json
 import logging
 import os
-import platform
+import pkgutil
 import subprocess
 import sys
-import tempfile
+import threading
+import time
 
 import click
 import requests
 import semantic_version
 
-from pioinstaller import exception, util
+from pioinstaller import (
+    __version__,
+    core,
+    download,
+    exception,
+    http,
+    pathindex,
+    probe,
+    timing,
+    util,
+)
 
 log = logging.getLogger(__name__)
 
-
-def is_conda():
-    return any(
-        [
-            os.path.exists(os.path.join(sys.prefix, "conda-meta")),
-            # (os.getenv("CONDA_PREFIX") or os.getenv("CONDA_DEFAULT_ENV")),
-            "anaconda" in sys.executable.lower(),
-            "miniconda" in sys.executable.lower(),
-            "continuum analytics" in sys.version.lower(),
-            "conda" in sys.version.lower(),
-        ]
-    )
+PROBE_MAX_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+PROBE_CACHE_FILENAME = "python-probes.json"
+PORTABLE_PYTHON_CONNECTIONS = 4
+PORTABLE_PYTHON_REGISTRY_URL = (
+    "https://api.registry.platformio.org/v3/packages/platformio/tool/python-portable"
+)
+PORTABLE_PYTHON_INDEX_FILENAME = "python-portable-index.json"
+PORTABLE_PYTHON_INDEX_TTL = 24 * 3600
 
 
 def is_portable():
@@ -67,23 +76,38 @@ def is_portable():
 
 
 def fetch_portable_python(dst):
-    url = get_portable_python_url()
-    if not url:
+    try:
+        item = get_portable_python_item()
+    except Exception as e:  # pylint:disable=broad-except
+        log.debug("Could not resolve portable Python: %s", str(e))
+        item = None
+    if not item:
         log.debug("Could not find portable Python for %s", util.get_systype())
         return None
+    url = item["download_url"]
     try:
-        log.debug("Downloading portable python...")
-
-        archive_path = util.download_file(
-            url, os.path.join(os.path.join(dst, ".cache", "tmp"), os.path.basename(url))
-        )
-
         python_dir = os.path.join(dst, "python3")
         util.safe_remove_dir(python_dir)
         util.safe_create_dir(python_dir, raise_exception=True)
 
-        log.debug("Unpacking portable python...")
-        util.unpack_archive(archive_path, python_dir)
+        try:
+            log.debug("Downloading and unpacking portable python...")
+            download.download_and_unpack(url, python_dir, sha256=item["sha256"])
+        except Exception as e:  # pylint:disable=broad-except
+            log.debug("Could not unpack portable python on the fly: %s", str(e))
+            log.debug("Downloading portable python...")
+            archive_path = download.download_file(
+                url,
+                os.path.join(os.path.join(dst, ".cache", "tmp"), os.path.basename(url)),
+                sha256=item["sha256"],
+                connections=PORTABLE_PYTHON_CONNECTIONS,
+            )
+
+            util.safe_remove_dir(python_dir)
+            util.safe_create_dir(python_dir, raise_exception=True)
+
+            log.debug("Unpacking portable python...")
+            util.unpack_archive(archive_path, python_dir)
         if util.IS_WINDOWS:
             return os.path.join(python_dir, "python.exe")
         return os.path.join(python_dir, "bin", "python3")
@@ -93,88 +117,146 @@ def fetch_portable_python(dst):
 
 
 def get_portable_python_url():
-    systype = util.get_systype()
-    result = requests.get(
-        "https://api.registry.platformio.org/v3/packages/"
-        "platformio/tool/python-portable",
-        timeout=10,
-    ).json()
-    versions = [
-        version
-        for version in result["versions"]
-        if is_version_system_compatible(version, systype)
-    ]
-    best_version = {}
-    for version in versions:
-        if not best_version or semantic_version.Version(
-            version["name"]
-        ) > semantic_version.Version(best_version["name"]):
-            best_version = version
-    for item in best_version.get("files", []):
-        if systype in item["system"]:
-            return item["download_url"]
-    return None
+    item = get_portable_python_item()
+    return item["download_url"] if item else None
 
 
-def is_version_system_compatible(version, systype):
-    return any(systype in item["system"] for item in version["files"])
+def get_portable_python_item(systype=None):
+    index = load_portable_python_index()
+    return index.get(systype or util.get_systype())
 
 
-def check():
-    # platform check
-    if sys.platform == "cygwin":
-        raise exception.IncompatiblePythonError("Unsupported Cygwin platform")
+def get_portable_python_index_path():
+    return os.path.join(core.get_cache_dir(), PORTABLE_PYTHON_INDEX_FILENAME)
 
-    # version check
-    if sys.version_info < (3, 6):
-        raise exception.IncompatiblePythonError(
-            "Unsupported Python version: %s. "
-            "Minimum supported Python version is 3.6 or above."
-            % platform.python_version(),
-        )
 
-    # conda check
-    if is_conda():
-        raise exception.IncompatiblePythonError("Conda is not supported")
+def load_portable_python_index(ttl=PORTABLE_PYTHON_INDEX_TTL):
+    """
+    Systype -> the best `python-portable` file. The registry listing is
+    revalidated with ETag after `ttl` seconds, the last known-good index is
+    used when the registry is unreachable
+    """
+    cache_path = get_portable_python_index_path()
+    cached = {}
+    try:
+        with open(cache_path) as fp:
+            cached = json.load(fp)
+        assert isinstance(cached.get("index"), dict)
+        assert cached.get("url") == PORTABLE_PYTHON_REGISTRY_URL
+    except:  # pylint:disable=bare-except
+        cached = {}
+    if cached and 0 <= time.time() - cached.get("time", 0) < ttl:
+        return cached["index"]
 
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
     try:
-        __import__("ensurepip")
-        __import__("venv")
-        # __import__("distutils.command")
-    except ImportError:
-        raise exception.PythonVenvModuleNotFound()
+        resp = http.get_session().get(PORTABLE_PYTHON_REGISTRY_URL, headers=headers)
+        if resp.status_code == 304 and cached:
+            log.debug("Portable Python registry listing is not modified")
+            cached["time"] = time.time()
+            util.dump_json_atomic(cache_path, cached)
+            return cached["index"]
+        resp.raise_for_status()
+        index = build_portable_python_index(resp.json())
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        if not cached:
+            raise
+        log.debug("Using cached portable Python registry listing: %s", str(e))
+        return cached["index"]
+    util.dump_json_atomic(
+        cache_path,
+        {
+            "url": PORTABLE_PYTHON_REGISTRY_URL,
+            "etag": resp.headers.get("ETag"),
+            "time": time.time(),
+            "index": index,
+        },
+    )
+    return index
+
+
+def build_portable_python_index(listing):
+    best_versions = {}
+    for version in listing["versions"]:
+        for item in version["files"]:
+            for systype in item["system"]:
+                best = best_versions.get(systype)
+                if best and semantic_version.Version(
+                    best[0]
+                ) >= semantic_version.Version(version["name"]):
+                    continue
+                best_versions[systype] = (version["name"], item)
+    return {
+        systype: {
+            "version": name,
+            "download_url": item["download_url"],
+            "sha256": (item.get("checksum") or {}).get("sha256"),
+        }
+        for systype, (name, item) in best_versions.items()
+    }
 
-    # portable Python 3 for macOS is not compatible with macOS < 10.13
-    # https://github.com/platformio/platformio-core-installer/issues/70
-    if util.IS_MACOS:
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            os.utime(tmpfile.name)
 
-    if not util.IS_WINDOWS:
-        return True
+def check():
+    reason = probe.get_incompatibility_reason()
+    if reason == probe.VENV_MODULE_NOT_FOUND:
+        raise exception.PythonVenvModuleNotFound()
+    if reason:
+        raise exception.IncompatiblePythonError(reason)
+    return True
 
-    # windows check
-    if any(s in util.get_pythonexe_path().lower() for s in ("msys", "mingw", "emacs")):
-        raise exception.IncompatiblePythonError(
-            "Unsupported environments: msys, mingw, emacs >> %s"
-            % util.get_pythonexe_path(),
-        )
 
-    try:
-        assert os.path.isdir(os.path.join(sys.prefix, "Scripts")) or (
-            sys.version_info >= (3, 5) and __import__("venv")
-        )
-    except (AssertionError, ImportError):
-        raise exception.IncompatiblePythonError(
-            "Unsupported python without 'Scripts' folder and 'venv' module"
-        )
+@functools.lru_cache(maxsize=None)
+def get_probe_code():
+    return pkgutil.get_data("pioinstaller", "probe.py").decode()
 
-    return True
 
+class PythonProbeRunner(object):
+    """
+    Run Python probes in a bounded thread pool, kill running ones on cancel
+    """
 
-def find_compatible_pythons(
-    ignore_pythons=None, raise_exception=True
-):  # pylint: disable=too-many-branches
+    def __init__(self, max_workers=None):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or PROBE_MAX_WORKERS
+        )
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._cancelled = False
+
+    def submit(self, executable):
+        return self._executor.submit(self._probe, executable)
+
+    def _probe(self, executable):
+        with self._lock:
+            if self._cancelled:
+                return None
+            proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                [executable, "-c", get_probe_code()],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            self._processes.add(proc)
+        try:
+            output, error = proc.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(proc)
+        return proc.returncode, output, error
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            for proc in self._processes:
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
+        self._executor.shutdown(wait=True)
+
+
+def get_python_candidates(ignore_pythons=None):
     ignore_list = []
     for p in ignore_pythons or []:
         ignore_list.extend(glob.glob(p))
@@ -190,52 +272,180 @@ def find_compatible_pythons(
     if util.IS_WINDOWS:
         exenames = ["%s.exe" % item for item in exenames]
     log.debug("Current environment PATH %s", os.getenv("PATH"))
-    candidates = []
-    for exe in exenames:
-        for path in os.getenv("PATH").split(os.pathsep):
-            if not os.path.isfile(os.path.join(path, exe)):
-                continue
-            candidates.append(os.path.join(path, exe))
-
-    if sys.executable in candidates:
-        candidates.remove(sys.executable)
+    candidates = pathindex.find_programs(exenames)
     # put current Python to the top of list
     candidates.insert(0, sys.executable)
+    candidates = [item for item in candidates if item not in ignore_list]
+    # the same interpreter is often reachable via several symlinks or hard links
+    return pathindex.unique_paths(candidates, key=get_python_id)
+
+
+def is_virtualenv_python(executable):
+    bin_dir = os.path.dirname(os.path.abspath(executable))
+    return os.path.isfile(os.path.join(os.path.dirname(bin_dir), "pyvenv.cfg"))
 
-    result = []
+
+def get_python_id(executable):
+    """
+    Interpreters inside a virtual environment share a binary with their base
+    Python but not `sys.prefix`, so they are identified by their own path
+    """
+    if is_virtualenv_python(executable):
+        return os.path.normcase(os.path.normpath(os.path.abspath(executable)))
+    return pathindex.get_file_id(executable)
+
+
+def get_probe_cache_path():
+    return os.path.join(core.get_cache_dir(), PROBE_CACHE_FILENAME)
+
+
+def load_probe_cache():
+    try:
+        with open(get_probe_cache_path()) as fp:
+            data = json.load(fp)
+        assert isinstance(data, dict)
+        return data
+    except:  # pylint:disable=bare-except
+        pass
+    return {}
+
+
+def save_probe_cache(entries):
+    # merge with entries saved by concurrent installer runs
+    data = load_probe_cache()
+    data.update(entries)
+    util.dump_json_atomic(get_probe_cache_path(), data)
+
+
+def clear_probe_cache():
+    path = get_probe_cache_path()
+    if os.path.isfile(path):
+        os.remove(path)
+    return True
+
+
+def get_probe_cache_key(executable):
+    if is_virtualenv_python(executable):
+        return os.path.normpath(os.path.abspath(executable))
+    return os.path.realpath(executable)
+
+
+def get_python_fingerprint(executable):
+    try:
+        st = os.stat(os.path.realpath(executable))
+    except OSError:
+        return None
+    return {"inode": st.st_ino, "size": st.st_size, "mtime": st.st_mtime}
+
+
+def parse_probe_output(returncode, output, error=""):
+    try:
+        result = json.loads(output)
+        assert returncode == 0 and isinstance(result, dict)
+        return {
+            "compatible": bool(result.get("compatible")),
+            "version": result.get("version"),
+            "reason": result.get("reason"),
+            "venv_missing": bool(result.get("venv_missing")),
+        }
+    except (AssertionError, ValueError):
+        pass
+    # the interpreter could not run the probe at all
+    lines = (error or output).strip().splitlines()
+    return {
+        "compatible": False,
+        "version": None,
+        "reason": lines[-1] if lines else "Exit code %d" % returncode,
+        "venv_missing": False,
+    }
+
+
+def find_compatible_pythons(ignore_pythons=None, raise_exception=True):
+    return list(iter_compatible_pythons(ignore_pythons, raise_exception))
+
+
+def is_probe_cache_valid(entry, fingerprint):
+    return bool(
+        entry
+        and entry.get("compatible")
+        and fingerprint
+        and entry.get("installer_version") == __version__
+        and all(entry.get(k) == v for k, v in fingerprint.items())
+    )
+
+
+def _read_probe_result(future):
+    try:
+        returncode, output, error = future.result()
+    except Exception as e:  # pylint: disable=broad-except
+        log.debug(e)
+        return None
+    output = output.decode(errors="replace").strip()
+    error = error.decode(errors="replace").strip()
+    for text in (output, error):
+        if text:
+            log.debug(text)
+    # a negative code means that a probe was killed by a signal
+    if returncode < 0:
+        return None
+    return parse_probe_output(returncode, output, error)
+
+
+def iter_compatible_pythons(
+    ignore_pythons=None, raise_exception=True
+):  # pylint: disable=too-many-branches,too-many-locals
+    """
+    Yield compatible Pythons in priority order, closing the generator cancels probes
+    """
+    # measured until the first compatible Python, the caller uses it meanwhile
+    span = timing.start_span("find_compatible_pythons")
+    candidates = get_python_candidates(ignore_pythons)
+    cache = load_probe_cache()
+    new_cache_entries = {}
+    runner = PythonProbeRunner(max_workers=min(len(candidates), PROBE_MAX_WORKERS))
+    found = False
     missed_venv_module = False
-    for item in candidates:
-        if item in ignore_list:
-            continue
-        log.debug("Checking a Python candidate %s", item)
-        try:
-            output = subprocess.check_output(
-                [
-                    item,
-                    util.get_installer_script(),
-                    "--no-shutdown-piohome",
-                    "check",
-                    "python",
-                ],
-                stderr=subprocess.STDOUT,
-            )
-            result.append(item)
-            try:
-                log.debug(output.decode().strip())
-            except UnicodeDecodeError:
-                pass
-        except subprocess.CalledProcessError as e:
+    try:
+        probes = []
+        for item in candidates:
+            key = get_probe_cache_key(item)
+            fingerprint = get_python_fingerprint(item)
+            entry = cache.get(key)
+            if not is_probe_cache_valid(entry, fingerprint):
+                entry = runner.submit(item)
+            probes.append((item, key, fingerprint, entry))
+
+        for item, key, fingerprint, result in probes:
+            if isinstance(result, dict):
+                log.debug("Using cached result for a Python candidate %s", item)
+                entry = result
+            else:
+                log.debug("Checking a Python candidate %s", item)
+                entry = _read_probe_result(result)
+                if not entry:
+                    continue
+                # an incompatible interpreter is often fixed without touching
+                # its binary (e.g. by installing `python3.X-venv`), re-probe it
+                if fingerprint and entry["compatible"]:
+                    entry.update(fingerprint)
+                    entry["installer_version"] = __version__
+                    new_cache_entries[key] = entry
+            if not entry["compatible"]:
+                missed_venv_module = missed_venv_module or entry["venv_missing"]
+                continue
+            found = True
+            span.finish()
+            yield item
+    finally:
+        span.finish()
+        runner.cancel()
+        if new_cache_entries:
             try:
-                error = e.output.decode()
-                if error and "`venv` module" in error:
-                    missed_venv_module = True
-                log.debug(error)
-            except UnicodeDecodeError:
-                pass
-        except Exception as e:  # pylint: disable=broad-except
-            log.debug(e)
-
-    if not result and raise_exception:
+                save_probe_cache(new_cache_entries)
+            except Exception as e:  # pylint: disable=broad-except
+                log.debug("Could not save Python probe cache: %s", str(e))
+
+    if not found and raise_exception:
         if missed_venv_module:
             # pylint:disable=line-too-long
             raise click.ClickException(
@@ -253,5 +463,3 @@ $ apt-get install python3.%d-venv
             "Please install the latest official Python 3 and restart installation:\n"
             "https://docs.platformio.org/page/faq.html#install-python-interpreter"
         )
-
-    return result
@@ -0,0 +1,168 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import inspect
+import json
+import logging
+import os
+import platform
+import queue
+import sys
+import threading
+
+from pioinstaller import core, exception, python, timing, util
+
+log = logging.getLogger(__name__)
+
+DEFAULT_IDLE_TIMEOUT = 600
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INSTALLER_ERROR = -32000
+
+
+class RPCError(Exception):
+    def __init__(self, code, message):
+        super(RPCError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+def check_core(develop=False, global_=False, auto_upgrade=True, version_spec=None):
+    timing.reset()
+    state = core.check(
+        develop=develop,
+        global_=global_,
+        auto_upgrade=auto_upgrade,
+        version_spec=version_spec,
+    )
+    return dict(state, spans=timing.get_spans())
+
+
+def check_python():
+    try:
+        python.check()
+        reason = None
+    except (exception.IncompatiblePythonError, exception.PythonVenvModuleNotFound) as e:
+        reason = str(e)
+    return {
+        "compatible": reason is None,
+        "python_version": platform.python_version(),
+        "python_exe": util.get_pythonexe_path(),
+        "reason": reason,
+    }
+
+
+def install(shutdown_piohome=True, develop=False, ignore_pythons=None, wheelhouse=None):
+    timing.reset()
+    core.install_platformio_core(shutdown_piohome, develop, ignore_pythons, wheelhouse)
+    return {"installed": True, "spans": timing.get_spans()}
+
+
+METHODS = {
+    "check.core": check_core,
+    "check.python": check_python,
+    "install": install,
+}
+
+
+def handle_request(request, defaults=None):
+    """
+    Result of a JSON-RPC request, `None` for notifications
+    """
+    request_id = request.get("id") if isinstance(request, dict) else None
+    try:
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            raise RPCError(INVALID_REQUEST, "Invalid Request")
+        method = METHODS.get(request["method"])
+        if not method:
+            raise RPCError(METHOD_NOT_FOUND, "Method not found: %s" % request["method"])
+        params = request.get("params") or {}
+        if not isinstance(params, dict):
+            raise RPCError(INVALID_PARAMS, "Params must be an object")
+        if request["method"] != "check.python":
+            params = dict(defaults or {}, **params)
+        # `global` is a reserved word in Python
+        params = {("global_" if k == "global" else k): v for k, v in params.items()}
+        try:
+            inspect.signature(method).bind(**params)
+        except TypeError as e:
+            raise RPCError(INVALID_PARAMS, str(e))
+        try:
+            result = method(**params)
+        except Exception as e:  # pylint: disable=broad-except
+            # a failed request must not stop the server
+            log.debug("Request %s has failed", request["method"], exc_info=True)
+            raise RPCError(INSTALLER_ERROR, str(e) or e.__class__.__name__)
+        response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+    except RPCError as e:
+        response = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "error": {"code": e.code, "message": e.message},
+        }
+    if isinstance(request, dict) and "id" not in request:
+        return None
+    return response
+
+
+def _read_lines(stream, lines):
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+def serve(idle_timeout=DEFAULT_IDLE_TIMEOUT, defaults=None):
+    """
+    Answer line-delimited JSON-RPC requests from stdin until EOF or until no
+    request arrives for `idle_timeout` seconds
+    """
+    # keep stdout for responses, the rest of output (including child
+    # processes) goes to stderr
+    sys.stdout.flush()
+    output = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    lines = queue.Queue()
+    reader = threading.Thread(target=_read_lines, args=(sys.stdin, lines))
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=idle_timeout)
+            except queue.Empty:
+                log.debug("Idle timeout of %d seconds is reached", idle_timeout)
+                break
+            if line is None:
+                break
+            if not line.strip():
+                continue
+            try:
+                response = handle_request(json.loads(line), defaults)
+            except ValueError:
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": None,
+                    "error": {"code": PARSE_ERROR, "message": "Parse error"},
+                }
+            if response is not None:
+                output.write(json.dumps(response) + "\n")
+                output.flush()
+    finally:
+        output.close()
+    return True
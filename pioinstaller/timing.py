@@ -0,0 +1,186 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import functools
+import sys
+import threading
+import time
+
+# subprocesses are counted with an audit hook, Python 3.8+
+SUBPROCESS_COUNTING = hasattr(sys, "addaudithook")
+
+_lock = threading.Lock()
+_local = threading.local()
+_counters = {"subprocesses": 0, "bytes_downloaded": 0}
+_roots = []
+_audit_hook_installed = False
+
+
+class Span(object):
+    """
+    A timed phase. Counters are process-wide, a span records what happened
+    in all threads while it was open
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.duration = None
+        self.subprocesses = None
+        self.bytes_downloaded = None
+        self.children = []
+        self._start = None
+        self._counters = None
+
+    def start(self):
+        self._counters = dict(_counters)
+        self._start = time.time()
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = time.time() - self._start
+        self.subprocesses = _counters["subprocesses"] - self._counters["subprocesses"]
+        self.bytes_downloaded = (
+            _counters["bytes_downloaded"] - self._counters["bytes_downloaded"]
+        )
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "subprocesses": self.subprocesses if SUBPROCESS_COUNTING else None,
+            "bytes_downloaded": self.bytes_downloaded,
+            "children": [child.as_dict() for child in self.children],
+        }
+
+
+def _audit_hook(event, _):
+    if event == "subprocess.Popen":
+        add_subprocess()
+
+
+def _install_audit_hook():
+    global _audit_hook_installed  # pylint: disable=global-statement
+    with _lock:
+        if _audit_hook_installed or not SUBPROCESS_COUNTING:
+            return
+        sys.addaudithook(_audit_hook)
+        _audit_hook_installed = True
+
+
+def _get_stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def add_subprocess():
+    with _lock:
+        _counters["subprocesses"] += 1
+
+
+def add_bytes_downloaded(size):
+    with _lock:
+        _counters["bytes_downloaded"] += size
+
+
+def start_span(name):
+    """
+    A span that does not become a parent of the following ones, for phases
+    that are suspended, such as generators. The caller finishes it
+    """
+    _install_audit_hook()
+    stack = _get_stack()
+    item = Span(name)
+    if stack:
+        stack[-1].children.append(item)
+    else:
+        with _lock:
+            _roots.append(item)
+    item.start()
+    return item
+
+
+@contextlib.contextmanager
+def span(name):
+    item = start_span(name)
+    stack = _get_stack()
+    stack.append(item)
+    try:
+        yield item
+    finally:
+        item.finish()
+        stack.pop()
+
+
+def timed(name=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_spans():
+    with _lock:
+        return [item.as_dict() for item in _roots]
+
+
+def reset():
+    with _lock:
+        del _roots[:]
+
+
+def _format_size(size):
+    if not size:
+        return "-"
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return "%d %s" % (size, unit) if unit == "B" else "%.1f %s" % (size, unit)
+        size /= 1024.0
+    return "%.1f GB" % size
+
+
+def format_table(spans):
+    rows = []
+
+    def _walk(items, depth):
+        for item in items:
+            rows.append(
+                (
+                    "  " * depth + item["name"],
+                    "%.3fs" % item["duration"] if item["duration"] is not None else "-",
+                    "-" if item["subprocesses"] is None else str(item["subprocesses"]),
+                    _format_size(item["bytes_downloaded"]),
+                )
+            )
+            _walk(item["children"], depth + 1)
+
+    _walk(spans, 0)
+    header = ("Phase", "Time", "Subprocesses", "Downloaded")
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(4)]
+    lines = []
+    for row in [header, tuple("-" * width for width in widths)] + rows:
+        lines.append(
+            "  ".join(
+                [row[0].ljust(widths[0])]
+                + [value.rjust(width) for value, width in zip(row[1:], widths[1:])]
+            )
+        )
+    return "\n".join(lines)
@@ -12,18 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import io
+import json
 import logging
 import os
 import platform
 import re
 import shutil
 import stat
-import subprocess
 import sys
 import tarfile
 
-import requests
+from pioinstaller import pathindex
 
 IS_WINDOWS = sys.platform.lower().startswith("win")
 IS_MACOS = sys.platform.lower() == "darwin"
@@ -88,20 +87,13 @@ def safe_create_dir(path, raise_exception=False):
     return None
 
 
-def download_file(url, dst, cache=True):
-    if cache:
-        content_length = requests.head(url, timeout=10).headers.get("Content-Length")
-        if os.path.isfile(dst) and content_length == os.path.getsize(dst):
-            log.debug("Getting from cache: %s", dst)
-            return dst
-
-    resp = requests.get(url, stream=True, timeout=10)
-    itercontent = resp.iter_content(chunk_size=io.DEFAULT_BUFFER_SIZE)
-    safe_create_dir(os.path.dirname(dst))
-    with open(dst, "wb") as fp:
-        for chunk in itercontent:
-            fp.write(chunk)
-    return dst
+def dump_json_atomic(path, data):
+    safe_create_dir(os.path.dirname(path))
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as fp:
+        json.dump(data, fp)
+    os.replace(tmp_path, path)
+    return path
 
 
 def unpack_archive(src, dst):
@@ -111,10 +103,6 @@ def unpack_archive(src, dst):
     return dst
 
 
-def get_installer_script():
-    return os.path.abspath(sys.argv[0])
-
-
 def get_systype():
     type_ = platform.system().lower()
     arch = platform.machine().lower()
@@ -123,6 +111,15 @@ def get_systype():
     return "%s_%s" % (type_, arch) if arch else type_
 
 
+def safe_remove_file(path, raise_exception=False):
+    try:
+        return os.remove(path)
+    except Exception as e:  # pylint: disable=broad-except
+        if raise_exception and os.path.exists(path):
+            raise e
+    return None
+
+
 def safe_remove_dir(path, raise_exception=False):
     try:
         return rmtree(path)
@@ -137,29 +134,8 @@ def pepver_to_semver(pepver):
 
 
 def where_is_program(program, envpath=None):
-    env = os.environ
-    if envpath:
-        env["PATH"] = envpath
-
-    # try OS's built-in commands
-    try:
-        result = (
-            subprocess.check_output(
-                ["where" if IS_WINDOWS else "which", program], env=env
-            )
-            .decode()
-            .strip()
-        )
-        if os.path.isfile(result):
-            return result
-    except (subprocess.CalledProcessError, OSError):
-        pass
-
-    # look up in $PATH
-    for bin_dir in env.get("PATH", "").split(os.pathsep):
-        if os.path.isfile(os.path.join(bin_dir, program)):
-            return os.path.join(bin_dir, program)
-        if os.path.isfile(os.path.join(bin_dir, "%s.exe" % program)):
-            return os.path.join(bin_dir, "%s.exe" % program)
-
+    for name in (program, "%s.exe" % program):
+        path = pathindex.where_is(name, envpath or None)
+        if path:
+            return path
     return program
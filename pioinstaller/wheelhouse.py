@@ -0,0 +1,309 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import concurrent.futures
+import glob
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import threading
+import time
+import zipfile
+from urllib.parse import unquote, urlparse
+from urllib.request import url2pathname
+
+from pioinstaller import core, download, util
+
+log = logging.getLogger(__name__)
+
+LOCK_FILENAME = "wheelhouse.lock.json"
+EMBEDDED_DIR = "wheelhouse"
+PREFETCH_MAX_WORKERS = 8
+
+# wheel tags depend on the Python version, platform and pointer size
+PYTHON_TAGS_CODE = (
+    "import json, platform, struct, sysconfig; "
+    "print(json.dumps({'python': '.'.join(platform.python_version_tuple()[:2]), "
+    "'platform': sysconfig.get_platform(), 'bits': struct.calcsize('P') * 8}))"
+)
+
+
+def get_core_requirement(version_spec=None, develop=False):
+    if develop:
+        return core.PIO_CORE_DEVELOP_URL
+    if not version_spec:
+        return "platformio"
+    if version_spec[0].isdigit():
+        return "platformio==%s" % version_spec
+    return "platformio%s" % version_spec
+
+
+def get_python_version(version=None):
+    return ".".join((version or platform.python_version()).split(".")[:2])
+
+
+def get_python_tags(python_exe=None):
+    """
+    Properties of an interpreter that decide which wheels it can install
+    """
+    if not python_exe or python_exe == sys.executable:
+        return {
+            "python": get_python_version(),
+            "platform": sysconfig.get_platform(),
+            "bits": struct.calcsize("P") * 8,
+        }
+    return json.loads(
+        subprocess.check_output(
+            [python_exe, "-c", PYTHON_TAGS_CODE], stderr=subprocess.PIPE
+        ).decode()
+    )
+
+
+def parse_wheel_filename(filename):
+    match = re.match(r"^([^-]+)-([^-]+)-.+\.whl$", filename)
+    if not match:
+        return None
+    return (re.sub(r"[-_.]+", "-", match.group(1)).lower(), match.group(2))
+
+
+def find_file(wheelhouse_dir, pattern):
+    if not wheelhouse_dir:
+        return None
+    paths = sorted(glob.glob(os.path.join(wheelhouse_dir, pattern)))
+    return paths[-1] if paths else None
+
+
+def get_embedded_payload():
+    """
+    The zip archive the installer is imported from when it runs as a packed
+    `get-platformio.py` script
+    """
+    path = os.path.dirname(util.get_source_dir())
+    return path if os.path.isfile(path) and zipfile.is_zipfile(path) else None
+
+
+def extract_embedded(dst_dir):
+    payload = get_embedded_payload()
+    if not payload:
+        return None
+    with zipfile.ZipFile(payload) as zf:
+        members = [
+            info
+            for info in zf.infolist()
+            if info.filename.startswith(EMBEDDED_DIR + "/")
+            and not info.filename.endswith("/")
+        ]
+        if not members:
+            return None
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir)
+        for info in members:
+            with zf.open(info) as src, open(
+                os.path.join(dst_dir, os.path.basename(info.filename)), "wb"
+            ) as dst:
+                shutil.copyfileobj(src, dst)
+    return dst_dir
+
+
+def get_lock_path(wheelhouse_dir):
+    return os.path.join(wheelhouse_dir, LOCK_FILENAME)
+
+
+def build(wheelhouse_dir, requirement, python_exe=None):
+    """
+    Fill `wheelhouse_dir` with wheels for `requirement` and its dependency tree
+    and pin them in a lock manifest. Wheels from a previous run are reused
+    """
+    python_exe = python_exe or sys.executable
+    if not os.path.isdir(wheelhouse_dir):
+        os.makedirs(wheelhouse_dir)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        subprocess.check_call(
+            [
+                python_exe,
+                "-m",
+                "pip",
+                "wheel",
+                "--wheel-dir",
+                tmp_dir,
+                "--find-links",
+                wheelhouse_dir,
+                requirement,
+            ]
+        )
+        wheels = []
+        for filename in sorted(os.listdir(tmp_dir)):
+            name_version = parse_wheel_filename(filename)
+            if not name_version:
+                continue
+            path = os.path.join(wheelhouse_dir, filename)
+            shutil.move(os.path.join(tmp_dir, filename), path)
+            with open(path, "rb") as fp:
+                sha256 = hashlib.sha256(fp.read()).hexdigest()
+            wheels.append(
+                {
+                    "name": name_version[0],
+                    "version": name_version[1],
+                    "filename": filename,
+                    "sha256": sha256,
+                }
+            )
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    python_tags = get_python_tags(python_exe)
+    lock = {
+        "requirement": requirement,
+        "python": python_tags["python"],
+        "platform": python_tags["platform"],
+        "bits": python_tags["bits"],
+        "created_on": int(round(time.time())),
+        "wheels": wheels,
+    }
+    util.dump_json_atomic(get_lock_path(wheelhouse_dir), lock)
+    return lock
+
+
+def load_lock(wheelhouse_dir):
+    try:
+        with open(get_lock_path(wheelhouse_dir)) as fp:
+            lock = json.load(fp)
+        assert isinstance(lock.get("wheels"), list) and lock["wheels"]
+        return lock
+    except:  # pylint:disable=bare-except
+        pass
+    return None
+
+
+def get_locked_paths(wheelhouse_dir, python_tags):
+    """
+    Locked wheels when the lock manifest matches the tags of the target
+    interpreter, see `get_python_tags`
+    """
+    lock = load_lock(wheelhouse_dir) if wheelhouse_dir else None
+    if not lock or any(lock.get(key) != value for key, value in python_tags.items()):
+        return None
+    paths = [os.path.join(wheelhouse_dir, item["filename"]) for item in lock["wheels"]]
+    if not all(os.path.isfile(path) for path in paths):
+        log.debug("Wheelhouse lock manifest refers to missing wheels")
+        return None
+    return paths
+
+
+def get_install_args(wheelhouse_dir, python_tags):
+    """
+    PIP arguments to install PlatformIO Core from a local wheelhouse. The locked
+    wheels are installed as-is, without dependency resolution, when the lock
+    manifest matches the target interpreter
+    """
+    paths = get_locked_paths(wheelhouse_dir, python_tags)
+    if paths:
+        return ["--no-index", "--no-deps"] + paths
+    return ["--no-index", "--find-links", wheelhouse_dir, "platformio"]
+
+
+class WheelPrefetch(object):
+    """
+    Resolve a requirement with `pip install --dry-run --report` and download
+    the wheels of its dependency tree concurrently in a background thread
+    """
+
+    def __init__(self, requirement, dest_dir, python_exe=None):
+        self.requirement = requirement
+        self.dest_dir = dest_dir
+        self.python_exe = python_exe or sys.executable
+        self.python_tags = None
+        self.paths = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.paths
+
+    def get_install_args(self, python_tags):
+        """
+        The prefetched tree is resolved for `python_exe` and can be installed
+        without resolution only into an interpreter with the same tags
+        """
+        if not self.paths or python_tags != self.python_tags:
+            return None
+        return ["--no-index", "--no-deps"] + self.paths
+
+    def _run(self):
+        start = time.time()
+        try:
+            self.paths = self._prefetch()
+            log.debug(
+                "Prefetched %d wheels in %.2fs", len(self.paths), time.time() - start
+            )
+        except Exception as e:  # pylint:disable=broad-except
+            log.debug("Could not prefetch wheels: %s", str(e))
+
+    def _prefetch(self):
+        self.python_tags = get_python_tags(self.python_exe)
+        if not os.path.isdir(self.dest_dir):
+            os.makedirs(self.dest_dir)
+        report_path = os.path.join(self.dest_dir, "report.json")
+        subprocess.run(
+            [
+                self.python_exe,
+                "-m",
+                "pip",
+                "install",
+                "--dry-run",
+                "--ignore-installed",
+                "--quiet",
+                "--report",
+                report_path,
+                self.requirement,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        with open(report_path) as fp:
+            items = [item["download_info"] for item in json.load(fp)["install"]]
+        if not all(urlparse(item["url"]).path.endswith(".whl") for item in items):
+            raise ValueError("Dependency tree contains source distributions")
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=PREFETCH_MAX_WORKERS
+        ) as executor:
+            return list(executor.map(self._fetch, items))
+
+    def _fetch(self, download_info):
+        url = download_info["url"]
+        dst = os.path.join(self.dest_dir, os.path.basename(unquote(urlparse(url).path)))
+        if url.startswith("file:"):
+            shutil.copyfile(url2pathname(urlparse(url).path), dst)
+            return dst
+        hashes = (download_info.get("archive_info") or {}).get("hashes") or {}
+        # wheel URLs change with every release, do not keep them in the cache
+        return download.download_file(
+            url, dst, cache=False, sha256=hashes.get("sha256")
+        )
@@ -12,6 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
 import pytest
 
 from pioinstaller.pack import packer
@@ -21,3 +26,86 @@ from pioinstaller.pack import packer
 def pio_installer_script(tmpdir_factory):
     tmpdir = tmpdir_factory.mktemp("pioinstaller")
     return packer.pack(str(tmpdir))
+
+
+class StubHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StubHTTPRequestHandler)
+        self.files = {}
+        self.requests = []
+        self.bytes_sent = 0
+        # drop the next `drop_connections` responses after `drop_after` bytes
+        self.drop_connections = 0
+        self.drop_after = 0
+        self.accept_ranges = True
+        # ignore `Range` after `range_responses` partial responses
+        self.range_responses = None
+
+    def url(self, path):
+        return "http://%s:%d%s" % (self.server_address[0], self.server_address[1], path)
+
+
+class StubHTTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        start, end = 0, len(content) - 1
+        is_range = bool(
+            self.server.accept_ranges
+            and self.headers.get("Range")
+            and self.headers.get("If-Range", etag) == etag
+            and self.server.range_responses != 0
+        )
+        if is_range and self.server.range_responses is not None:
+            self.server.range_responses -= 1
+        if is_range:
+            start, end = self.headers["Range"].split("=")[1].split("-")
+            start, end = int(start), int(end or len(content) - 1)
+            if start >= len(content):
+                self.send_error(416)
+                return
+        body = content[start : end + 1]
+        self.send_response(206 if is_range else 200)
+        self.send_header("ETag", etag)
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(body)))
+        if is_range:
+            self.send_header(
+                "Content-Range", "bytes %d-%d/%d" % (start, end, len(content))
+            )
+        self.end_headers()
+        if self.server.drop_connections > 0:
+            self.server.drop_connections -= 1
+            body = body[: self.server.drop_after]
+            self.close_connection = True
+        # counted first, a client may assert right after it reads the body
+        self.server.bytes_sent += len(body)
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = StubHTTPServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
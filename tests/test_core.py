@@ -15,13 +15,14 @@
 import json
 import os
 import subprocess
+import sys
 
-from pioinstaller import __version__, core, penv, util
+import pytest
 
+from pioinstaller import __version__, core, exception, penv, util
 
-def test_install_pio_core(pio_installer_script, tmpdir, monkeypatch):
-    monkeypatch.setattr(util, "get_installer_script", lambda: pio_installer_script)
 
+def test_install_pio_core(pio_installer_script, tmpdir):
     core_dir = tmpdir.mkdir(".pio")
     penv_dir = str(core_dir.mkdir("penv"))
     os.environ["PLATFORMIO_CORE_DIR"] = str(core_dir)
@@ -60,3 +61,77 @@ def test_install_pio_core(pio_installer_script, tmpdir, monkeypatch):
             "platformio.exe" if util.IS_WINDOWS else "platformio",
         )
     )
+
+
+def test_fetch_core_state(tmpdir, monkeypatch):
+    pkg_dir = tmpdir.mkdir("platformio")
+    pkg_dir.join("__init__.py").write('__version__ = "6.1.15"\n')
+    pkg_dir.join("__main__.py").write("def main():\n    pass\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmpdir))
+
+    state = core.fetch_core_state(sys.executable)
+    assert state["core_version"] == "6.1.15"
+    assert state["python_version"] == "%d.%d.%d" % sys.version_info[:3]
+    assert set(state["timings"]) == set(
+        ["python", "core", "entry_point", "pip", "probe"]
+    )
+
+    # broken CLI entry point
+    pkg_dir.join("__main__.py").write("import missing_module\n")
+    with pytest.raises(exception.InvalidPlatformIOCore, match="PlatformIO Core CLI"):
+        core.fetch_core_state(sys.executable)
+
+    # PlatformIO Core is not installed
+    monkeypatch.setenv("PYTHONPATH", str(tmpdir.mkdir("empty")))
+    with pytest.raises(exception.InvalidPlatformIOCore, match="import PlatformIO"):
+        core.fetch_core_state(sys.executable)
+
+
+def test_cached_core_state(tmpdir, monkeypatch):
+    if util.IS_WINDOWS:
+        return
+    monkeypatch.setenv("PLATFORMIO_CORE_DIR", str(tmpdir))
+    penv_dir = tmpdir.mkdir("penv")
+    penv_dir.join("pyvenv.cfg").write("home = %s\n" % os.path.dirname(sys.executable))
+    penv_dir.join("state.json").write("{}")
+    python_exe = str(penv_dir.mkdir("bin").join("python"))
+    os.symlink(sys.executable, python_exe)
+    dist_info_dir = (
+        penv_dir.mkdir("lib")
+        .mkdir("python3.11")
+        .mkdir("site-packages")
+        .mkdir("platformio-6.1.15.dist-info")
+    )
+    dist_info_dir.join("METADATA").write("Name: platformio\nVersion: 6.1.15\n\n")
+    dist_info_dir.join("RECORD").write("platformio/__init__.py,,\n")
+
+    assert core.load_cached_core_state(python_exe) is None
+    assert core.save_cached_core_state(
+        python_exe,
+        {"core_version": "6.1.15", "python_version": "3.11.7", "timings": {}},
+    )
+    state = core.load_cached_core_state(python_exe)
+    assert state["core_version"] == "6.1.15"
+    assert state["python_version"] == "3.11.7"
+    assert "fingerprint" in state["timings"]
+
+    # PlatformIO Core has been reinstalled
+    dist_info_dir.join("RECORD").write("platformio/__init__.py,,\nplatformio/x.py,,\n")
+    assert core.load_cached_core_state(python_exe) is None
+
+
+def test_pip_install_fallback(monkeypatch):
+    commands = []
+
+    def _check_call(command):
+        commands.append(command)
+        if "--no-index" in command:
+            raise subprocess.CalledProcessError(1, command)
+        return 0
+
+    monkeypatch.setattr(core.subprocess, "check_call", _check_call)
+    command = ["python", "-m", "pip", "install", "-U"]
+    local_args = ["--no-index", "--no-deps", "platformio-6.1.15-py3-none-any.whl"]
+    assert core._pip_install(command, local_args, "platformio") == 0
+    # wheels the interpreter does not accept are installed from the index
+    assert commands == [command + local_args, command + ["platformio"]]
@@ -0,0 +1,263 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+import pytest
+import requests
+
+from pioinstaller import download, exception, http
+
+
+def test_download_cache(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    content = os.urandom(200 * 1024)
+    http_server.files["/file.bin"] = content
+    url = http_server.url("/file.bin")
+    dst = str(tmpdir.join("file.bin"))
+
+    assert download.download_file(url, dst) == dst
+    with open(dst, "rb") as fp:
+        assert fp.read() == content
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert os.path.isfile(download.get_object_path(sha256))
+
+    # revalidated with ETag, nothing is transferred
+    os.remove(dst)
+    assert download.download_file(url, dst) == dst
+    assert http_server.requests[-1][2].get("If-None-Match")
+    assert http_server.bytes_sent == len(content)
+    with open(dst, "rb") as fp:
+        assert fp.read() == content
+
+    # a known checksum does not need network at all
+    requests_nums = len(http_server.requests)
+    download.download_file(url, dst, sha256=sha256)
+    assert len(http_server.requests) == requests_nums
+
+    # the remote file has been changed
+    http_server.files["/file.bin"] = b"new content"
+    download.download_file(url, dst)
+    with open(dst, "rb") as fp:
+        assert fp.read() == b"new content"
+    assert not os.path.isfile(download.get_object_path(sha256))
+
+    # offline mode uses the last cached copy
+    http_server.shutdown()
+    http_server.server_close()
+    os.remove(dst)
+    download.download_file(url, dst)
+    with open(dst, "rb") as fp:
+        assert fp.read() == b"new content"
+
+
+def test_download_checksum_mismatch(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    http_server.files["/file.bin"] = b"content"
+    url = http_server.url("/file.bin")
+    dst = str(tmpdir.join("file.bin"))
+
+    with pytest.raises(exception.DownloadError):
+        download.download_file(url, dst, sha256="0" * 64)
+    assert not os.path.isfile(dst)
+    assert not download.load_meta(url)
+
+    with pytest.raises(requests.HTTPError):
+        download.download_file(http_server.url("/unknown.bin"), dst)
+
+
+def test_resume_download(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    content = os.urandom(1024 * 1024)
+    http_server.files["/file.bin"] = content
+    http_server.drop_connections = 2
+    http_server.drop_after = 300 * 1024
+    url = http_server.url("/file.bin")
+    dst = str(tmpdir.join("file.bin"))
+
+    download.download_file(url, dst, sha256=hashlib.sha256(content).hexdigest())
+    with open(dst, "rb") as fp:
+        assert fp.read() == content
+    assert http_server.bytes_sent == len(content)
+    assert [r[2].get("Range") for r in http_server.requests] == [
+        None,
+        "bytes=307200-",
+        "bytes=614400-",
+    ]
+
+
+def test_resume_complete_download(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    content = os.urandom(100 * 1024)
+    http_server.files["/file.bin"] = content
+    url = http_server.url("/file.bin")
+    dst = str(tmpdir.join("file.bin"))
+
+    # a complete part file left by an interrupted run
+    part_path = download.get_part_path(url)
+    os.makedirs(os.path.dirname(part_path))
+    with open(part_path, "wb") as fp:
+        fp.write(content)
+    with open(part_path + ".json", "w") as fp:
+        json.dump(
+            {"url": url, "validator": '"%s"' % hashlib.sha1(content).hexdigest()}, fp
+        )
+
+    download.download_file(url, dst)
+    with open(dst, "rb") as fp:
+        assert fp.read() == content
+    assert [r[2].get("Range") for r in http_server.requests] == [
+        "bytes=%d-" % len(content),
+        None,
+    ]
+
+
+def test_resume_changed_download(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    http_server.files["/file.bin"] = os.urandom(1024 * 1024)
+    http_server.drop_connections = download.MAX_ATTEMPTS
+    http_server.drop_after = 100 * 1024
+    url = http_server.url("/file.bin")
+    dst = str(tmpdir.join("file.bin"))
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download.download_file(url, dst, cache=False)
+    assert os.path.getsize(dst + ".part") == download.MAX_ATTEMPTS * 100 * 1024
+
+    # the next run does not append to a file that has been changed on a server
+    content = os.urandom(1024 * 1024)
+    http_server.files["/file.bin"] = content
+    download.download_file(url, dst, cache=False)
+    with open(dst, "rb") as fp:
+        assert fp.read() == content
+    assert http_server.requests[-1][2].get("If-Range")
+    assert not os.path.exists(dst + ".part")
+
+
+def test_segmented_download(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    monkeypatch.setattr(download, "SEGMENTED_MIN_SIZE", 1024)
+    content = os.urandom(1024 * 1024 + 1)
+    http_server.files["/file.bin"] = content
+    http_server.drop_connections = 1
+    http_server.drop_after = 100 * 1024
+    url = http_server.url("/file.bin")
+    dst = str(tmpdir.join("file.bin"))
+
+    download.download_file(url, dst, connections=4)
+    with open(dst, "rb") as fp:
+        assert fp.read() == content
+    ranges = sorted(r[2].get("Range") for r in http_server.requests)
+    assert len(ranges) == 5  # one of segments has been resumed
+    assert "bytes=102400-262144" in ranges
+    assert "bytes=786435-1048576" in ranges
+
+    # a server without ranges support
+    http_server.accept_ranges = False
+    http_server.requests = []
+    http_server.files["/file.bin"] = content[::-1]
+    download.download_file(url, dst, cache=False, connections=4)
+    with open(dst, "rb") as fp:
+        assert fp.read() == content[::-1]
+    assert len(http_server.requests) == 1
+
+
+def test_segmented_download_fallback(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    monkeypatch.setattr(download, "SEGMENTED_MIN_SIZE", 1024)
+    # the restart with a single connection is not a retry
+    monkeypatch.setattr(download, "MAX_ATTEMPTS", 1)
+    content = os.urandom(1024 * 1024)
+    http_server.files["/file.bin"] = content
+    http_server.range_responses = 1
+    url = http_server.url("/file.bin")
+    dst = str(tmpdir.join("file.bin"))
+
+    download.download_file(url, dst, connections=4)
+    with open(dst, "rb") as fp:
+        assert fp.read() == content
+    assert http_server.requests[-1][2].get("Range") is None
+
+
+def test_download_and_unpack(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    payload = os.urandom(512 * 1024)
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as tf:
+        tarinfo = tarfile.TarInfo("bin/python3")
+        tarinfo.size = len(payload)
+        tf.addfile(tarinfo, io.BytesIO(payload))
+    content = data.getvalue()
+    http_server.files["/python.tar.gz"] = content
+    url = http_server.url("/python.tar.gz")
+
+    python_dir = tmpdir.mkdir("python")
+    download.download_and_unpack(url, str(python_dir))
+    assert python_dir.join("bin", "python3").read_binary() == payload
+    assert os.path.isfile(download.get_object_path(hashlib.sha256(content).hexdigest()))
+
+    # unpacked from cache
+    python_dir = tmpdir.mkdir("python-cached")
+    download.download_and_unpack(url, str(python_dir))
+    assert python_dir.join("bin", "python3").read_binary() == payload
+    assert http_server.bytes_sent == len(content)
+
+    # a known object is unpacked without a request
+    requests_nums = len(http_server.requests)
+    python_dir = tmpdir.mkdir("python-object")
+    download.download_and_unpack(
+        url, str(python_dir), sha256=hashlib.sha256(content).hexdigest()
+    )
+    assert python_dir.join("bin", "python3").read_binary() == payload
+    assert len(http_server.requests) == requests_nums
+
+    # unverified files are not left in place
+    python_dir = tmpdir.mkdir("python-mismatch")
+    with pytest.raises(exception.DownloadError):
+        download.download_and_unpack(
+            url, str(python_dir), sha256=hashlib.sha256(b"").hexdigest()
+        )
+    assert not python_dir.check()
+    assert not tmpdir.listdir(lambda p: p.basename.endswith(".tmp"))
+
+    # an interrupted stream is resumed by `download_file`
+    http_server.files["/python.tar.gz"] = content + b"\0" * 1024
+    http_server.drop_connections = 1
+    http_server.drop_after = 100 * 1024
+    with pytest.raises(Exception):
+        download.download_and_unpack(url, str(tmpdir.mkdir("python-broken")))
+    dst = str(tmpdir.join("python.tar.gz"))
+    download.download_file(url, dst)
+    assert http_server.requests[-1][2].get("Range") == "bytes=102400-"
+    with open(dst, "rb") as fp:
+        assert fp.read() == content + b"\0" * 1024
+
+
+def test_http_session_reuses_connections(http_server):
+    for i in range(5):
+        http_server.files["/file%d.bin" % i] = os.urandom(1024)
+    session = http.HTTPSession()
+    for i in range(5):
+        resp = session.get(http_server.url("/file%d.bin" % i))
+        assert resp.status_code == 200
+        assert resp.content == http_server.files["/file%d.bin" % i]
+    assert session.get_connections_count() == 1
+    assert all(
+        headers["User-Agent"].startswith("platformio-installer/")
+        for _, _, headers in http_server.requests
+    )
@@ -0,0 +1,96 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from pioinstaller import home
+
+
+class StubHomeRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        if "__shutdown__" in self.path:
+            threading.Thread(target=self.server.shutdown).start()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def start_stub_home_server():
+    server = HTTPServer((home.HTTP_HOST, 0), StubHomeRequestHandler)
+
+    def _serve():
+        server.serve_forever()
+        server.server_close()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    return server.server_address[1]
+
+
+def get_free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((home.HTTP_HOST, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_find_listening_ports():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind((home.HTTP_HOST, 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    free_port = get_free_port()
+    try:
+        assert home.find_listening_ports([free_port, port]) == [port]
+    finally:
+        listener.close()
+    assert home.find_listening_ports([port]) == []
+
+
+def test_find_listening_ports_wouldblock(monkeypatch):
+    class WindowsSocket(socket.socket):
+        def connect(self, address):
+            try:
+                super(WindowsSocket, self).connect(address)
+            except BlockingIOError:
+                # Windows reports a pending connection as WSAEWOULDBLOCK
+                raise BlockingIOError(10035, "WSAEWOULDBLOCK")
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind((home.HTTP_HOST, 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    free_port = get_free_port()
+    monkeypatch.setattr(socket, "socket", WindowsSocket)
+    try:
+        assert home.find_listening_ports([free_port, port]) == [port]
+    finally:
+        listener.close()
+
+
+def test_shutdown_servers():
+    ports = [start_stub_home_server() for _ in range(3)]
+    free_port = get_free_port()
+    assert home.find_listening_ports(ports + [free_port]) == sorted(ports)
+    start = time.time()
+    assert home.shutdown_servers(ports) == ports
+    assert time.time() - start < 5
+    assert home.find_listening_ports(ports) == []
+    assert home.shutdown_servers([]) == []
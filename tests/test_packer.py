@@ -12,11 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
+import io
+import json
+import os
+import re
 import subprocess
+import time
+import zipfile
 
-from pioinstaller import __version__
+import click
+import pytest
+
+from pioinstaller import __version__, wheelhouse
+from pioinstaller.pack import packer
 
 
 def test_pioinstaller_packer(pio_installer_script):
     output = subprocess.check_output(["python", pio_installer_script, "--version"])
     assert ("version %s" % __version__) in output.decode()
+
+
+def test_pioinstaller_packer_with_core(tmpdir):
+    script = packer.pack(str(tmpdir.join("get-platformio.py")), with_core=True)
+    with open(script) as fp:
+        payload = re.search(r'b"""\n(.+)\n"""', fp.read(), re.S).group(1)
+    with zipfile.ZipFile(io.BytesIO(base64.b64decode(payload))) as zf:
+        names = zf.namelist()
+        lock = json.loads(zf.read("wheelhouse/%s" % wheelhouse.LOCK_FILENAME))
+    assert "pioinstaller/__main__.py" in names
+    assert any(name.startswith("wheelhouse/pip-") for name in names)
+    assert any(item["name"] == "platformio" for item in lock["wheels"])
+    for item in lock["wheels"]:
+        assert "wheelhouse/%s" % item["filename"] in names
+
+
+def test_pioinstaller_payload_cache(pio_installer_script, tmpdir):
+    cache_dir = tmpdir.mkdir("cache")
+    payloads_dir = cache_dir.mkdir("installer")
+    old_payload = payloads_dir.join("pioinstaller-0000.zip")
+    old_payload.write("")
+    old_payload.setmtime(time.time() - 60 * 60 * 24 * 30)
+    env = dict(os.environ, PLATFORMIO_CACHE_DIR=str(cache_dir))
+    for _ in range(2):
+        output = subprocess.check_output(
+            ["python", pio_installer_script, "--version"], env=env
+        )
+        assert ("version %s" % __version__) in output.decode()
+    names = os.listdir(str(payloads_dir))
+    assert len(names) == 1
+    assert re.match(r"^pioinstaller-[0-9a-f]{64}\.zip$", names[0])
+
+    # a truncated payload is decoded again
+    payload = payloads_dir.join(names[0])
+    size = payload.size()
+    payload.write("")
+    output = subprocess.check_output(
+        ["python", pio_installer_script, "--version"], env=env
+    )
+    assert ("version %s" % __version__) in output.decode()
+    assert payload.size() == size
+
+
+def test_pioinstaller_packer_zipapp(tmpdir):
+    target = packer.pack(str(tmpdir), format_="pyz")
+    assert target.endswith(".pyz")
+    with open(target, "rb") as fp:
+        assert fp.readline() == packer.ZIPAPP_SHEBANG
+    with zipfile.ZipFile(target) as zf:
+        assert "__main__.py" in zf.namelist()
+    output = subprocess.check_output(["python", target, "--version"])
+    assert ("version %s" % __version__) in output.decode()
+
+
+def test_pioinstaller_packer_reproducible(tmpdir):
+    for format_ in ("script", "pyz"):
+        targets = [
+            packer.pack(str(tmpdir.mkdir("%s%d" % (format_, i))), format_=format_)
+            for i in range(2)
+        ]
+        with open(targets[0], "rb") as fp1, open(targets[1], "rb") as fp2:
+            assert fp1.read() == fp2.read()
+
+
+def test_pioinstaller_packer_wheels_failure(tmpdir):
+    package_dir = tmpdir.mkdir("package")
+    package_dir.join("setup.py").write("raise SystemExit(1)\n")
+    package_dir.join("README.rst").write("")
+    package_dir.mkdir("pioinstaller")
+    with pytest.raises(click.ClickException):
+        packer.get_wheels_dir(str(package_dir))
+    # a failed build is not cached
+    assert not package_dir.join(".cache", "wheels").listdir()
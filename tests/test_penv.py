@@ -19,9 +19,7 @@ import subprocess
 from pioinstaller import __version__, penv, python, util
 
 
-def test_penv_with_default_python(pio_installer_script, tmpdir, monkeypatch):
-    monkeypatch.setattr(util, "get_installer_script", lambda: pio_installer_script)
-
+def test_penv_with_default_python(pio_installer_script, tmpdir):
     penv_dir = str(tmpdir.mkdir("penv"))
 
     assert penv.create_core_penv(penv_dir=penv_dir)
@@ -38,9 +36,7 @@ def test_penv_with_default_python(pio_installer_script, tmpdir, monkeypatch):
         assert json_info.get("installer_version") == __version__
 
 
-def test_penv_with_downloadable_venv(pio_installer_script, tmpdir, monkeypatch):
-    monkeypatch.setattr(util, "get_installer_script", lambda: pio_installer_script)
-
+def test_penv_with_downloadable_venv(pio_installer_script, tmpdir):
     penv_dir = str(tmpdir.mkdir("penv"))
 
     python_exes = python.find_compatible_pythons()
@@ -59,11 +55,9 @@ def test_penv_with_downloadable_venv(pio_installer_script, tmpdir, monkeypatch):
     )
 
 
-def test_penv_with_portable_python(pio_installer_script, tmpdir, monkeypatch):
+def test_penv_with_portable_python(pio_installer_script, tmpdir):
     if not util.IS_WINDOWS:
         return
-    monkeypatch.setattr(util, "get_installer_script", lambda: pio_installer_script)
-
     penv_dir = str(tmpdir.mkdir("penv"))
 
     python_exe = python.fetch_portable_python(os.path.dirname(penv_dir))
@@ -76,3 +70,30 @@ def test_penv_with_portable_python(pio_installer_script, tmpdir, monkeypatch):
         subprocess.check_call([python_exe, pio_installer_script, "check", "python"])
         == 0
     )
+
+
+def test_penv_from_template(tmpdir, monkeypatch):
+    if util.IS_WINDOWS:
+        return
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    python_exe = python.find_compatible_pythons()[0]
+
+    penv_dirs = [str(tmpdir.join("penv1")), str(tmpdir.join("penv2"))]
+    for penv_dir in penv_dirs:
+        assert penv.create_from_template(python_exe, penv_dir) == penv_dir
+    template_dir = penv.get_penv_template_dir(python_exe)
+    assert penv.load_penv_template_manifest(template_dir)
+    assert os.listdir(penv.get_penv_templates_dir()) == [os.path.basename(template_dir)]
+
+    for penv_dir in penv_dirs:
+        bin_dir = penv.get_penv_bin_dir(penv_dir)
+        assert not os.path.exists(os.path.join(penv_dir, penv.PENV_TEMPLATE_MANIFEST))
+        prefix = subprocess.check_output(
+            [os.path.join(bin_dir, "python"), "-c", "import sys; print(sys.prefix)"]
+        )
+        assert os.path.samefile(prefix.decode().strip(), penv_dir)
+        with open(os.path.join(bin_dir, "pip")) as fp:
+            content = fp.read()
+            assert os.path.join(bin_dir, "python") in content
+            assert penv.get_penv_templates_dir() not in content
+        subprocess.check_call([os.path.join(bin_dir, "pip"), "--version"])
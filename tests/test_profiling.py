@@ -0,0 +1,58 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pstats
+import sys
+
+import pytest
+
+from pioinstaller import profiling
+
+
+def test_profile_dir(tmpdir, monkeypatch):
+    monkeypatch.delenv(profiling.PROFILE_DIR_ENV, raising=False)
+    state_path = str(tmpdir.join("state.json"))
+    expected = str(tmpdir.join(profiling.PROFILE_DIRNAME))
+    for argv in (
+        ["check", "core", "--dump-state", state_path],
+        ["check", "core", "--dump-state=%s" % state_path],
+        ["check", "core", "--dump-state", str(tmpdir)],
+    ):
+        assert profiling.get_profile_dir(argv) == expected
+
+
+def test_run(tmpdir, monkeypatch):
+    monkeypatch.delenv(profiling.PROFILE_ENV, raising=False)
+    assert profiling.run(lambda: 42) == 42
+    assert not os.listdir(str(tmpdir))
+
+    cpu_dir = str(tmpdir.join("cpu"))
+    assert profiling.run(lambda: sorted(range(1000)), "cpu", cpu_dir)
+    prof_path = [
+        os.path.join(cpu_dir, name)
+        for name in os.listdir(cpu_dir)
+        if name.endswith(".prof")
+    ][0]
+    assert pstats.Stats(prof_path).total_calls > 0
+
+    # a report is saved when the command fails
+    mem_dir = str(tmpdir.join("mem"))
+    monkeypatch.setenv(profiling.PROFILE_ENV, "mem")
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV, mem_dir)
+    with pytest.raises(SystemExit):
+        profiling.run(lambda: [bytearray(1024) for _ in range(100)] and sys.exit(1))
+    (name,) = os.listdir(mem_dir)
+    with open(os.path.join(mem_dir, name)) as fp:
+        assert fp.read().startswith("Peak traced memory")
@@ -12,11 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import json
 import os
+import platform
 import subprocess
+import sys
+import time
 
 import pytest
 
+from pioinstaller import python, util
+
 
 def test_check_default_python(pio_installer_script):
     assert (
@@ -31,3 +38,147 @@ def test_check_conda_python(pio_installer_script):
         subprocess.check_call(
             [os.getenv("MINICONDA"), pio_installer_script, "check", "python"]
         )
+
+
+def test_find_compatible_pythons():
+    pythons = python.find_compatible_pythons()
+    assert pythons[0] == sys.executable
+
+
+def test_cancel_python_probes(tmpdir, monkeypatch):
+    if util.IS_WINDOWS:
+        return
+    bin_dir = tmpdir.mkdir("bin")
+    slow_python = bin_dir.join("python3")
+    slow_python.write("#!/bin/sh\nexec sleep 30\n")
+    slow_python.chmod(0o755)
+    monkeypatch.setenv("PATH", os.pathsep.join([str(bin_dir), os.getenv("PATH")]))
+
+    start = time.time()
+    with contextlib.closing(python.iter_compatible_pythons()) as pythons:
+        assert next(pythons) == sys.executable
+    assert time.time() - start < 20
+
+
+def test_python_probe_cache(tmpdir, monkeypatch):
+    if util.IS_WINDOWS:
+        return
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir))
+    bin_dir = tmpdir.mkdir("bin")
+    broken_python = bin_dir.join("python3")
+    broken_python.write("#!/bin/sh\nexit 1\n")
+    broken_python.chmod(0o755)
+    monkeypatch.setenv("PATH", os.pathsep.join([str(bin_dir), os.getenv("PATH")]))
+
+    pythons = python.find_compatible_pythons()
+    with open(python.get_probe_cache_path()) as fp:
+        cache = json.load(fp)
+    entry = cache[python.get_probe_cache_key(sys.executable)]
+    assert entry["compatible"]
+    assert entry["version"] == platform.python_version()
+    # incompatible interpreters are probed again by the next run
+    assert python.get_probe_cache_key(str(broken_python)) not in cache
+    broken_python.remove()
+
+    submit = python.PythonProbeRunner.submit
+
+    def _submit(runner, executable):
+        assert executable not in pythons, "Python candidate should not be probed"
+        return submit(runner, executable)
+
+    monkeypatch.setattr(python.PythonProbeRunner, "submit", _submit)
+    assert python.find_compatible_pythons() == pythons
+
+    assert python.clear_probe_cache()
+    assert not os.path.isfile(python.get_probe_cache_path())
+
+
+def test_python_probe():
+    output = subprocess.check_output([sys.executable, "-c", python.get_probe_code()])
+    result = json.loads(output.decode())
+    assert result["compatible"]
+    assert result["version"] == platform.python_version()
+    assert python.parse_probe_output(0, output.decode())["compatible"]
+    assert not python.parse_probe_output(1, "", "SyntaxError")["compatible"]
+
+
+def test_python_candidates_deduplication(tmpdir, monkeypatch):
+    if util.IS_WINDOWS:
+        return
+    bin_dir = tmpdir.mkdir("bin")
+    other_bin_dir = tmpdir.mkdir("other-bin")
+    real_python = bin_dir.join("python3")
+    real_python.write("#!/bin/sh\n")
+    real_python.chmod(0o755)
+    bin_dir.join("python3.11").mksymlinkto(real_python)
+    os.link(str(real_python), str(other_bin_dir.join("python3")))
+    monkeypatch.setenv(
+        "PATH", os.pathsep.join([str(bin_dir), str(other_bin_dir), str(bin_dir)])
+    )
+
+    candidates = python.get_python_candidates()
+    assert candidates == [sys.executable, str(real_python)]
+    assert util.where_is_program("python3.11") == str(bin_dir.join("python3.11"))
+    assert util.where_is_program("unknown-program") == "unknown-program"
+
+
+def test_portable_python_index(http_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    monkeypatch.setattr(
+        python, "PORTABLE_PYTHON_REGISTRY_URL", http_server.url("/python-portable")
+    )
+
+    def _file(version, systems):
+        return {
+            "system": systems,
+            "download_url": "https://dl.example.com/python-%s.tar.gz" % version,
+            "checksum": {"sha256": version},
+        }
+
+    http_server.files["/python-portable"] = json.dumps(
+        {
+            "versions": [
+                {"name": "3.9.4", "files": [_file("3.9.4", ["linux_x86_64"])]},
+                {
+                    "name": "3.11.7",
+                    "files": [_file("3.11.7", ["linux_x86_64", "darwin_arm64"])],
+                },
+                {"name": "3.10.2", "files": [_file("3.10.2", ["windows_amd64"])]},
+            ]
+        }
+    ).encode()
+
+    index = python.load_portable_python_index()
+    assert {systype: item["version"] for systype, item in index.items()} == {
+        "linux_x86_64": "3.11.7",
+        "darwin_arm64": "3.11.7",
+        "windows_amd64": "3.10.2",
+    }
+    assert python.get_portable_python_item("linux_x86_64") == {
+        "version": "3.11.7",
+        "download_url": "https://dl.example.com/python-3.11.7.tar.gz",
+        "sha256": "3.11.7",
+    }
+    assert python.get_portable_python_item("unknown_systype") is None
+    assert len(http_server.requests) == 1
+
+    # served from the cache within TTL
+    assert python.load_portable_python_index() == index
+    assert len(http_server.requests) == 1
+
+    # revalidated with ETag after TTL
+    assert python.load_portable_python_index(ttl=0) == index
+    assert len(http_server.requests) == 2
+    assert "If-None-Match" in http_server.requests[-1][2]
+
+    # registry is unreachable, the last known-good index is used
+    del http_server.files["/python-portable"]
+    assert python.load_portable_python_index(ttl=0) == index
+    http_server.shutdown()
+    http_server.server_close()
+    assert python.load_portable_python_index(ttl=0) == index
+
+    # no cache and no registry
+    util.safe_remove_file(python.get_portable_python_index_path())
+    with pytest.raises(Exception):
+        python.load_portable_python_index()
@@ -0,0 +1,124 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from pioinstaller import rpc
+
+
+def test_handle_request():
+    response = rpc.handle_request({"jsonrpc": "2.0", "id": 1, "method": "check.python"})
+    assert response["id"] == 1
+    assert response["result"]["compatible"] is True
+
+    response = rpc.handle_request({"jsonrpc": "2.0", "id": 2, "method": "unknown"})
+    assert response["error"]["code"] == rpc.METHOD_NOT_FOUND
+
+    response = rpc.handle_request(
+        {"jsonrpc": "2.0", "id": 3, "method": "check.python", "params": {"x": 1}}
+    )
+    assert response["error"]["code"] == rpc.INVALID_PARAMS
+
+    # notification
+    assert rpc.handle_request({"jsonrpc": "2.0", "method": "check.python"}) is None
+
+
+def test_check_core_defaults(monkeypatch):
+    calls = []
+    monkeypatch.setattr(rpc.core, "check", lambda **kwargs: calls.append(kwargs) or {})
+
+    response = rpc.handle_request({"jsonrpc": "2.0", "id": 1, "method": "check.core"})
+    assert "result" in response
+    # the same defaults as `check core`
+    assert calls[-1]["auto_upgrade"] is True
+    assert calls[-1]["global_"] is False
+
+    rpc.handle_request(
+        {
+            "jsonrpc": "2.0",
+            "id": 2,
+            "method": "check.core",
+            "params": {"auto_upgrade": False},
+        }
+    )
+    assert calls[-1]["auto_upgrade"] is False
+
+
+def test_handle_request_errors(monkeypatch):
+    def _install(shutdown_piohome=True):
+        raise subprocess.CalledProcessError(1, ["pip", "install"])
+
+    def _check_core(develop=False):
+        raise TypeError("an internal error")
+
+    monkeypatch.setitem(rpc.METHODS, "install", _install)
+    monkeypatch.setitem(rpc.METHODS, "check.core", _check_core)
+
+    response = rpc.handle_request({"jsonrpc": "2.0", "id": 1, "method": "install"})
+    assert response["error"]["code"] == rpc.INSTALLER_ERROR
+    assert "pip" in response["error"]["message"]
+
+    response = rpc.handle_request({"jsonrpc": "2.0", "id": 2, "method": "check.core"})
+    assert response["error"] == {
+        "code": rpc.INSTALLER_ERROR,
+        "message": "an internal error",
+    }
+
+    response = rpc.handle_request(
+        {"jsonrpc": "2.0", "id": 3, "method": "install", "params": {"x": 1}}
+    )
+    assert response["error"]["code"] == rpc.INVALID_PARAMS
+
+
+def test_serve(tmpdir):
+    proc = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "pioinstaller", "serve", "--idle-timeout", "1"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        # PlatformIO Core is not installed there
+        env=dict(os.environ, PLATFORMIO_CORE_DIR=str(tmpdir)),
+    )
+    requests = [
+        {"jsonrpc": "2.0", "id": 1, "method": "check.python"},
+        {
+            "jsonrpc": "2.0",
+            "id": 2,
+            "method": "check.core",
+            "params": {"auto_upgrade": False},
+        },
+    ]
+    for request in requests:
+        proc.stdin.write(json.dumps(request) + "\n")
+    proc.stdin.write("not json\n")
+    proc.stdin.flush()
+
+    responses = [json.loads(proc.stdout.readline()) for _ in range(3)]
+    assert responses[0]["result"]["compatible"] is True
+    assert responses[1]["id"] == 2
+    assert "result" not in responses[1]
+    assert responses[1]["error"]["code"] == rpc.INSTALLER_ERROR
+    assert responses[2]["error"]["code"] == rpc.PARSE_ERROR
+
+    # stdin stays open, the server exits on the idle timeout
+    start = time.time()
+    assert proc.wait(timeout=30) == 0
+    assert time.time() - start < 10
+    assert proc.stdout.read() == ""
+    proc.stdin.close()
+    proc.stdout.close()
@@ -0,0 +1,57 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import sys
+
+from pioinstaller import download, timing
+
+
+@timing.timed()
+def run_python():
+    subprocess.check_call([sys.executable, "-c", "pass"])
+
+
+def test_spans(tmpdir, http_server, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    http_server.files["/file.bin"] = b"x" * 1000
+    timing.reset()
+    with timing.span("install"):
+        run_python()
+        pending = timing.start_span("discovery")
+        download.download_file(http_server.url("/file.bin"), str(tmpdir.join("f")))
+        pending.finish()
+
+    spans = timing.get_spans()
+    assert [item["name"] for item in spans] == ["install"]
+    children = spans[0]["children"]
+    assert [item["name"] for item in children] == [
+        "run_python",
+        "discovery",
+        "download_file",
+    ]
+    assert spans[0]["bytes_downloaded"] == 1000
+    assert children[2]["bytes_downloaded"] == 1000
+    assert children[0]["bytes_downloaded"] == 0
+    if timing.SUBPROCESS_COUNTING:
+        assert spans[0]["subprocesses"] == 1
+        assert children[0]["subprocesses"] == 1
+        assert children[2]["subprocesses"] == 0
+
+    table = timing.format_table(spans)
+    assert "  run_python" in table
+    assert "1000 B" in table
+
+    timing.reset()
+    assert timing.get_spans() == []
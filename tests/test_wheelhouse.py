@@ -0,0 +1,108 @@
+# Copyright (c) 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+from pioinstaller import core, download, wheelhouse
+
+
+def test_core_requirement():
+    assert wheelhouse.get_core_requirement() == "platformio"
+    assert wheelhouse.get_core_requirement("6.1.15") == "platformio==6.1.15"
+    assert wheelhouse.get_core_requirement(">=6,<7") == "platformio>=6,<7"
+    assert wheelhouse.get_core_requirement(develop=True) == core.PIO_CORE_DEVELOP_URL
+
+
+def test_python_tags():
+    python_tags = wheelhouse.get_python_tags()
+    assert python_tags["python"] == wheelhouse.get_python_version()
+    # the same tags are reported by an interpreter in a subprocess
+    assert (
+        json.loads(
+            subprocess.check_output(
+                [sys.executable, "-c", wheelhouse.PYTHON_TAGS_CODE]
+            ).decode()
+        )
+        == python_tags
+    )
+
+
+def test_wheelhouse(tmpdir):
+    wheelhouse_dir = str(tmpdir.join("wheelhouse"))
+    python_tags = wheelhouse.get_python_tags()
+    lock = wheelhouse.build(wheelhouse_dir, "semantic_version==2.8.5")
+    assert lock["python"] == python_tags["python"]
+    assert lock["platform"] == python_tags["platform"]
+    assert [(item["name"], item["version"]) for item in lock["wheels"]] == [
+        ("semantic-version", "2.8.5")
+    ]
+    assert wheelhouse.load_lock(wheelhouse_dir) == lock
+
+    wheel_path = os.path.join(wheelhouse_dir, lock["wheels"][0]["filename"])
+    assert wheelhouse.get_install_args(wheelhouse_dir, python_tags) == [
+        "--no-index",
+        "--no-deps",
+        wheel_path,
+    ]
+    assert wheelhouse.get_locked_paths(wheelhouse_dir, python_tags) == [wheel_path]
+    assert wheelhouse.get_locked_paths(None, python_tags) is None
+    # the lock does not match the target interpreter
+    other_tags = dict(python_tags, python="2.7")
+    assert wheelhouse.get_locked_paths(wheelhouse_dir, other_tags) is None
+    assert (
+        wheelhouse.get_locked_paths(wheelhouse_dir, dict(python_tags, bits=1)) is None
+    )
+    assert wheelhouse.get_install_args(wheelhouse_dir, other_tags) == [
+        "--no-index",
+        "--find-links",
+        wheelhouse_dir,
+        "platformio",
+    ]
+
+    target_dir = str(tmpdir.join("target"))
+    subprocess.check_call(
+        [sys.executable, "-m", "pip", "install", "--target", target_dir]
+        + wheelhouse.get_install_args(wheelhouse_dir, python_tags)
+    )
+    assert os.path.isdir(os.path.join(target_dir, "semantic_version"))
+
+
+def test_wheel_prefetch(tmpdir, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CACHE_DIR", str(tmpdir.mkdir("cache")))
+    prefetch_dir = str(tmpdir.join("prefetch"))
+    prefetch = wheelhouse.WheelPrefetch("semantic_version==2.8.5", prefetch_dir)
+    paths = prefetch.start().wait()
+    python_tags = wheelhouse.get_python_tags()
+    assert [os.path.basename(path) for path in paths] == [
+        "semantic_version-2.8.5-py2.py3-none-any.whl"
+    ]
+    assert (
+        prefetch.get_install_args(python_tags)
+        == [
+            "--no-index",
+            "--no-deps",
+        ]
+        + paths
+    )
+    assert prefetch.get_install_args(dict(python_tags, python="2.7")) is None
+    # wheels are staged in the install directory only
+    assert not os.path.isdir(download.get_download_cache_dir())
+
+    # a requirement that can not be resolved
+    prefetch = wheelhouse.WheelPrefetch("semantic_version==0.0.0", prefetch_dir)
+    assert prefetch.start().wait() is None
+    assert prefetch.get_install_args(python_tags) is None